@@ -0,0 +1,74 @@
+"""
+Auth Cache Module for MiraMind Professional
+Bounded LRU+TTL cache for resolved session tokens
+"""
+
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+
+def as_utc(value: datetime) -> datetime:
+    """Mongo returns naive UTC datetimes; make them comparable with aware ones"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class SessionCache:
+    """
+    Maps a session token to the principal it resolves to.
+
+    Entries are evicted least-recently-used once `maxsize` is reached, expire
+    after `ttl` seconds and are never served past the session's own expiry.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60):
+        self._entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Any]:
+        with self._lock:
+            entry: Optional[Tuple[Any, datetime]] = self._entries.get(token)
+            if entry is not None and entry[1] <= datetime.now(timezone.utc):
+                self._entries.pop(token, None)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token: str, principal: Any, expires_at: datetime) -> None:
+        with self._lock:
+            self._entries[token] = (principal, as_utc(expires_at))
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def invalidate_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Drop every entry whose principal matches; returns the number removed"""
+        with self._lock:
+            stale = [token for token, (principal, _) in self._entries.items() if predicate(principal)]
+            for token in stale:
+                self._entries.pop(token, None)
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self._entries.maxsize,
+                "ttl": self._entries.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
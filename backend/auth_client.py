@@ -0,0 +1,105 @@
+"""
+Auth Service Client Module for MiraMind Professional
+Application-lifetime pooled HTTP client for the Emergent Auth session exchange
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+# Upstream failures are retried; a 4xx is a definitive answer about the session id
+def is_retryable_status(status_code: int) -> bool:
+    return status_code >= 500
+
+
+class AuthServiceError(Exception):
+    """Auth service unreachable or failing after all retries"""
+
+
+class EmergentAuthClient:
+    """
+    Shared httpx client with connection pooling, explicit timeouts,
+    bounded retries with jittered backoff and latency metrics.
+
+    `transport` lets tests point the client at a local stand-in server
+    (e.g. httpx.MockTransport or an ASGI app) instead of AUTH_SERVICE_URL.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        max_connections: int = 100,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport
+        )
+        self._latencies_ms: deque = deque(maxlen=500)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    async def get_session_data(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Exchange an Emergent session id for the user's profile
+        Returns None if the auth service rejects the session id
+        """
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                resp = await self._client.get(
+                    "/auth/v1/env/oauth/session-data",
+                    headers={"X-Session-ID": session_id}
+                )
+                error: Optional[str] = f"HTTP {resp.status_code}" if is_retryable_status(resp.status_code) else None
+            except httpx.TransportError as e:
+                resp = None
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                self.requests += 1
+                self._latencies_ms.append((time.perf_counter() - started) * 1000)
+
+            if error is None:
+                return resp.json() if resp.status_code == 200 else None
+
+            if attempt >= self.max_retries:
+                self.failures += 1
+                raise AuthServiceError(error)
+
+            attempt += 1
+            self.retries += 1
+            # Full jitter keeps a login storm from retrying in lockstep
+            await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2)
+
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)}
+        }
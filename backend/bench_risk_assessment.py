@@ -0,0 +1,129 @@
+"""
+Benchmark for risk_assessment.analyze_message_risk
+Checks the normalized matcher against the previous lower()-and-scan
+version on random lowercase messages (where both must agree), shows inputs
+only the new matcher catches, then reports per-message cost on increasingly
+long messages (the chat path scores each message once, so nothing is cached).
+
+    python bench_risk_assessment.py [--iterations 200] [--seed 1]
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import Callable, Dict
+
+from risk_assessment import (
+    CRISIS_KEYWORDS, HIGH_RISK_KEYWORDS, SELF_HARM_KEYWORDS, SUICIDE_KEYWORDS,
+    analyze_message_risk
+)
+
+FILLER = (
+    "bugün biraz yorgunum ama iyiyim sanırım okul iş aile arkadaşlarım "
+    "akşam yürüyüşe çıktım uyku düzenim bozuk annemle konuştum hafta sonu"
+).split()
+
+
+def legacy_analyze_message_risk(message: str) -> Dict:
+    """The scan-per-keyword implementation this module replaced, kept as the reference"""
+    message_lower = message.lower()
+    risk = {
+        "risk_level": 0,
+        "risk_category": "low",
+        "suicide_risk": False,
+        "self_harm_risk": False,
+        "crisis_detected": False,
+        "risk_indicators": []
+    }
+    for keyword in SUICIDE_KEYWORDS:
+        if keyword in message_lower:
+            risk["suicide_risk"] = True
+            risk["risk_indicators"].append(f"İntihar göstergesi: '{keyword}'")
+            risk["risk_level"] += 4
+    for keyword in SELF_HARM_KEYWORDS:
+        if keyword in message_lower:
+            risk["self_harm_risk"] = True
+            risk["risk_indicators"].append(f"Kendine zarar göstergesi: '{keyword}'")
+            risk["risk_level"] += 3
+    for keyword in HIGH_RISK_KEYWORDS:
+        if keyword in message_lower:
+            risk["risk_indicators"].append(f"Yüksek risk göstergesi: '{keyword}'")
+            risk["risk_level"] += 5
+    for keyword in CRISIS_KEYWORDS:
+        if keyword in message_lower:
+            risk["crisis_detected"] = True
+            risk["risk_indicators"].append(f"Kriz göstergesi: '{keyword}'")
+            risk["risk_level"] += 2
+    for pattern in [r'hiçbir\s+şey', r'kimse\s+anlamıyor', r'artık\s+yok', r'sonsuza\s+kadar']:
+        if re.search(pattern, message_lower):
+            risk["risk_level"] += 1
+    risk["risk_level"] = min(risk["risk_level"], 10)
+    if risk["risk_level"] >= 8 or risk["suicide_risk"]:
+        risk["risk_category"] = "critical"
+    elif risk["risk_level"] >= 5 or risk["self_harm_risk"]:
+        risk["risk_category"] = "high"
+    elif risk["risk_level"] >= 3 or risk["crisis_detected"]:
+        risk["risk_category"] = "medium"
+    else:
+        risk["risk_category"] = "low"
+    return risk
+
+
+# Turkish casing, punctuation and stretched letters the old lower()-and-scan matcher missed
+MISSED_BEFORE = [
+    "İNTİHAR ETMEK İSTİYORUM",
+    "YALNIZIM VE ÇARESİZİM",
+    "ölmeeeek istiyorummm",
+    "kendime-zarar verdim",
+    "hiçbir... şey değişmiyor, kimse anlamıyor"
+]
+
+
+def random_message(rng: random.Random, words: int, keyword_rate: float, upper_rate: float = 0.0) -> str:
+    keywords = SUICIDE_KEYWORDS + SELF_HARM_KEYWORDS + HIGH_RISK_KEYWORDS + CRISIS_KEYWORDS + [
+        "hiçbir  şey", "kimse\tanlamıyor", "artık yok", "sonsuza kadar"
+    ]
+    parts = []
+    for _ in range(words):
+        if rng.random() < keyword_rate:
+            keyword = rng.choice(keywords)
+            parts.append(keyword.upper() if rng.random() < upper_rate else keyword)
+        else:
+            parts.append(rng.choice(FILLER))
+    return " ".join(parts)
+
+
+def per_message_us(fn: Callable[[str], Dict], message: str, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(message)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    for _ in range(2000):
+        message = random_message(rng, rng.randint(1, 60), 0.15)
+        assert analyze_message_risk(message) == legacy_analyze_message_risk(message), message
+    print("2000 random lowercase messages: identical output")
+    for message in MISSED_BEFORE:
+        before = legacy_analyze_message_risk(message)["risk_level"]
+        after = analyze_message_risk(message)["risk_level"]
+        print(f"  {message!r}: risk_level {before} -> {after}")
+
+    print(f"{'chars':>8} {'legacy µs':>11} {'normalized µs':>14} {'speedup':>8}")
+    for words in (20, 200, 2000, 20000):
+        message = random_message(rng, words, 0.002, upper_rate=0.2)
+        legacy = per_message_us(legacy_analyze_message_risk, message, args.iterations)
+        current = per_message_us(analyze_message_risk, message, args.iterations)
+        print(f"{len(message):>8} {legacy:>11.1f} {current:>14.1f} {legacy / current:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Circuit Breaker Module for MiraMind Professional
+Per provider/model breakers tracking error and slow-call rates, plus hedged
+calls to a fallback model so a degraded provider cannot hold requests hostage
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Awaitable, Callable, Deque, Dict, Optional, Tuple, Type
+
+
+class ProviderUnavailable(Exception):
+    """The breaker is open (or the call timed out), so the caller should degrade gracefully"""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"{name}: {reason}")
+        self.name = name
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """
+    Tracks the last `window` calls to one provider/model.
+
+    Opens once at least `min_calls` are recorded and the share of failures,
+    or of calls slower than `slow_call_seconds`, reaches `failure_rate`.
+    While open every call fails fast; after `open_seconds` a single probe is
+    let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 50,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 20.0,
+        open_seconds: float = 30.0
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        # (succeeded, latency seconds) per call, oldest first
+        self._calls: Deque[Tuple[bool, float]] = deque(maxlen=window)
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = "half_open"
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def _open(self) -> None:
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def record(self, succeeded: bool, latency: float) -> None:
+        if self.state == "half_open":
+            self._probe_in_flight = False
+            if succeeded and latency < self.slow_call_seconds:
+                self.state = "closed"
+                self._calls.clear()
+            else:
+                self._open()
+            self._calls.append((succeeded, latency))
+            return
+
+        self._calls.append((succeeded, latency))
+        if self.state == "closed" and len(self._calls) >= self.min_calls:
+            failed = sum(1 for ok, _ in self._calls if not ok)
+            slow = sum(1 for ok, latency in self._calls if ok and latency >= self.slow_call_seconds)
+            if max(failed, slow) >= self.failure_rate * len(self._calls):
+                self._open()
+
+    def release(self) -> None:
+        """The call was abandoned (cancelled, or refused upstream) without an outcome"""
+        if self.state == "half_open":
+            self._probe_in_flight = False
+
+    def p95(self) -> Optional[float]:
+        latencies = sorted(latency for ok, latency in self._calls if ok)
+        if len(latencies) < self.min_calls:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def stats(self) -> Dict[str, Any]:
+        calls = len(self._calls)
+        failed = sum(1 for ok, _ in self._calls if not ok)
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "calls": calls,
+            "error_rate": round(failed / calls, 3) if calls else 0.0,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakers:
+    """Breakers created on first use, keyed by "provider/model", sharing one configuration"""
+
+    def __init__(self, **config):
+        self.config = config
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        name = f"{provider}/{model}"
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(name, **self.config)
+        return breaker
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "breakers": {name: breaker.stats() for name, breaker in self._breakers.items()},
+        }
+
+
+async def guarded_call(
+    breaker: CircuitBreaker,
+    call: Callable[[], Awaitable[Any]],
+    timeout: float,
+    ignore: Tuple[Type[BaseException], ...] = (),
+    admit: Optional[Callable[[], AsyncContextManager]] = None,
+    admitted: Optional[asyncio.Event] = None
+) -> Any:
+    """
+    Run `call` through `breaker` with a hard timeout. Exceptions in `ignore`
+    (e.g. local backpressure) pass through without counting against the provider.
+
+    `admit` is a local admission context (e.g. a scheduler slot) held around the
+    call; waiting for it is not provider latency, so the timeout and the latency
+    clock only start once it is entered, which also sets `admitted`.
+    """
+    if not breaker.allow():
+        raise ProviderUnavailable(breaker.name, "circuit open")
+    recorded = False
+    try:
+        async with (admit() if admit is not None else nullcontext()):
+            if admitted is not None:
+                admitted.set()
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(call(), timeout=timeout)
+            except asyncio.TimeoutError:
+                breaker.record(False, time.monotonic() - started)
+                recorded = True
+                raise ProviderUnavailable(breaker.name, "timed out") from None
+            except (asyncio.CancelledError, *ignore):
+                raise
+            except Exception:
+                breaker.record(False, time.monotonic() - started)
+                recorded = True
+                raise
+            breaker.record(True, time.monotonic() - started)
+            recorded = True
+            return result
+    finally:
+        if not recorded:
+            breaker.release()
+
+
+CallSpec = Tuple  # (breaker, call) or (breaker, call, admit), as taken by guarded_call
+
+
+async def hedged_call(
+    breakers: CircuitBreakers,
+    primary: CallSpec,
+    fallback: Optional[CallSpec],
+    timeout: float,
+    hedge_delay: float,
+    ignore: Tuple[Type[BaseException], ...] = ()
+) -> Any:
+    """
+    Start the primary call; if it has not finished `hedge_delay` seconds after
+    being admitted, or fails first, start the fallback too. The first success
+    wins and the other call is cancelled. Raises the last error if both fail.
+    An `ignore`d error from the primary is raised as is: local backpressure
+    would hold the fallback back just the same.
+    """
+    def start(spec: CallSpec, admitted: Optional[asyncio.Event] = None) -> asyncio.Future:
+        breaker, call, *admit = spec
+        return asyncio.ensure_future(guarded_call(
+            breaker, call, timeout=timeout, ignore=ignore,
+            admit=admit[0] if admit else None, admitted=admitted
+        ))
+
+    admitted = asyncio.Event()
+    primary_task = start(primary, admitted)
+    pending = {primary_task}
+    hedged = fallback is None
+    last_error: Optional[BaseException] = None
+    try:
+        if not hedged:
+            # The hedge delay runs from admission, not from joining the local queue
+            admission = asyncio.ensure_future(admitted.wait())
+            try:
+                await asyncio.wait({primary_task, admission}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                admission.cancel()
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=None if hedged else hedge_delay,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary_task:
+                        breakers.hedge_wins += 1
+                    return task.result()
+                last_error = task.exception()
+                if task is primary_task and isinstance(last_error, ignore):
+                    raise last_error
+            if not hedged:
+                hedged = True
+                breakers.hedges += 1
+                pending.add(start(fallback))
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,214 @@
+"""
+Conversation Window Module for MiraMind Professional
+Bounded store of recent turns per active therapy session; the only place
+conversation state lives between LLM calls
+"""
+
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+
+class ConversationWindows:
+    """
+    Keeps the last `window_size` messages of each active session.
+
+    A window is seeded once from the database and then appended to on every
+    user/assistant write, so prompt assembly needs no read. Sessions idle for
+    longer than `idle_ttl` seconds, or beyond `max_sessions` / `max_bytes`,
+    are evicted least-recently-used first and simply re-seeded on their next
+    turn. Windows are per process and nothing tells one worker about
+    another's writes, so with several workers a session must be routed to the
+    same worker (sticky routing); PersistentConversationWindows checks
+    freshness against Mongo instead.
+    """
+
+    def __init__(
+        self,
+        window_size: int = 20,
+        max_sessions: int = 5000,
+        idle_ttl: float = 1800,
+        max_bytes: int = 256 * 1024 * 1024
+    ):
+        self.window_size = window_size
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._windows: "OrderedDict[Hashable, Deque[Dict[str, Any]]]" = OrderedDict()
+        self._last_access: Dict[Hashable, float] = {}
+        self._bytes: Dict[Hashable, int] = {}
+        # Version of the persisted copy each window matches, where there is one
+        self._versions: Dict[Hashable, int] = {}
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_reloads = 0
+
+    def _touch(self, key: Hashable) -> None:
+        self._windows.move_to_end(key)
+        self._last_access[key] = time.monotonic()
+
+    def _recount(self, key: Hashable) -> None:
+        size = sum(len(entry["content"].encode("utf-8")) for entry in self._windows[key])
+        self.resident_bytes += size - self._bytes.get(key, 0)
+        self._bytes[key] = size
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._windows:
+            oldest = next(iter(self._windows))
+            if (len(self._windows) <= self.max_sessions
+                    and self.resident_bytes <= self.max_bytes
+                    and self._last_access[oldest] > cutoff):
+                break
+            self.discard(oldest)
+            self.evictions += 1
+
+    def get(self, key: Hashable) -> Optional[List[Dict[str, Any]]]:
+        """Messages oldest-first, or None if the session has no window yet"""
+        self._evict()
+        window = self._windows.get(key)
+        if window is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(key)
+        return list(window)
+
+    def seed(self, key: Hashable, messages: List[Dict[str, Any]], version: Optional[int] = None) -> None:
+        if version is not None:
+            self._versions[key] = version
+        self._windows[key] = deque((self._entry(msg) for msg in messages[-self.window_size:]), maxlen=self.window_size)
+        self._touch(key)
+        self._recount(key)
+        self._evict()
+
+    def append(self, key: Hashable, message: Dict[str, Any]) -> bool:
+        """
+        Add a message to a seeded window; no-op for unseeded sessions, idempotent per message id
+        Returns True if the window changed
+        """
+        window = self._windows.get(key)
+        if window is None:
+            return False
+        if message.get("id") and any(entry.get("id") == message["id"] for entry in window):
+            return False
+        window.append(self._entry(message))
+        self._touch(key)
+        self._recount(key)
+        self._evict()
+        return True
+
+    def discard(self, key: Hashable) -> None:
+        self._windows.pop(key, None)
+        self._last_access.pop(key, None)
+        self._versions.pop(key, None)
+        self.resident_bytes -= self._bytes.pop(key, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._windows),
+            "max_sessions": self.max_sessions,
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "window_size": self.window_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_reloads": self.stale_reloads,
+        }
+
+    @staticmethod
+    def _entry(message: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": message.get("id"), "role": message["role"], "content": message["content"]}
+
+    # Persistence hooks; the in-memory store keeps nothing beyond the process
+    async def is_current(self, key: Hashable) -> bool:
+        """Whether the resident window has seen every persisted write"""
+        return True
+
+    async def load(self, key: Hashable) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """Persisted messages and their version"""
+        return None
+
+    async def save(self, key: Hashable, message: Dict[str, Any]) -> None:
+        return None
+
+    async def save_all(self, key: Hashable, messages: List[Dict[str, Any]]) -> None:
+        return None
+
+
+class PersistentConversationWindows(ConversationWindows):
+    """
+    Same bounds, plus a copy of each window in Mongo (one small document per
+    session), so evicted sessions, restarts and other workers reseed from a
+    single point read instead of a messages query.
+
+    Every write bumps the document's version. A resident window is only used
+    while its version matches (one projected point read per turn), so turns
+    alternating between workers still see each other's messages.
+    """
+
+    def __init__(self, collection, **kwargs):
+        super().__init__(**kwargs)
+        self.collection = collection
+
+    @staticmethod
+    def _doc_id(key: Hashable) -> str:
+        return ":".join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+
+    async def is_current(self, key: Hashable) -> bool:
+        doc = await self.collection.find_one({"_id": self._doc_id(key)}, {"version": 1})
+        if doc is not None and doc.get("version", 0) == self._versions.get(key):
+            return True
+        self.stale_reloads += 1
+        self.discard(key)
+        return False
+
+    async def load(self, key: Hashable) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        doc = await self.collection.find_one({"_id": self._doc_id(key)}, {"messages": 1, "version": 1})
+        return (doc["messages"], doc.get("version", 0)) if doc else None
+
+    def _written(self, key: Hashable, doc: Optional[Dict[str, Any]]) -> None:
+        if doc is None or key not in self._windows:
+            return
+        if self._versions.get(key) == doc["version"] - 1:
+            self._versions[key] = doc["version"]
+        else:
+            # Another worker wrote in between; reseed on the next turn
+            self.discard(key)
+
+    async def save(self, key: Hashable, message: Dict[str, Any]) -> None:
+        # No upsert: a window is only persisted once it has been seeded in full
+        doc = await self.collection.find_one_and_update(
+            {"_id": self._doc_id(key), "messages.id": {"$ne": message.get("id")}},
+            {
+                "$push": {"messages": {"$each": [self._entry(message)], "$slice": -self.window_size}},
+                "$set": {"updated_at": datetime.now(timezone.utc)},
+                "$inc": {"version": 1}
+            },
+            projection={"version": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        self._written(key, doc)
+
+    async def save_all(self, key: Hashable, messages: List[Dict[str, Any]]) -> None:
+        doc = await self.collection.find_one_and_update(
+            {"_id": self._doc_id(key)},
+            {
+                "$set": {
+                    "messages": [self._entry(msg) for msg in messages[-self.window_size:]],
+                    "updated_at": datetime.now(timezone.utc)
+                },
+                "$inc": {"version": 1}
+            },
+            projection={"version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is not None and key in self._windows:
+            self._versions[key] = doc["version"]
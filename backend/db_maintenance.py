@@ -0,0 +1,175 @@
+"""
+Database Maintenance Module for MiraMind Professional
+Declarative index registry, startup bootstrap and query-plan self-check
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Mongo error codes raised when an equivalent index exists under other options/name
+INDEX_CONFLICT_CODES = {85, 86}
+
+# Collections whose rows carry an expires_at and are purged once it passes
+SESSION_COLLECTIONS = ["user_sessions", "admin_sessions"]
+
+# Every index the API relies on, grouped by collection
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("user_id_number", ASCENDING)], name="user_id_number"),
+        IndexModel([("user_type", ASCENDING), ("account_status", ASCENDING), ("created_at", DESCENDING)],
+                   name="user_type_status_created"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("auth_updated_at", ASCENDING)], name="auth_updated_at", sparse=True),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING), ("expires_at", ASCENDING)], name="session_token_expires"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        IndexModel([("revoked_at", ASCENDING)], name="revoked_at", sparse=True),
+    ],
+    "admin_sessions": [
+        IndexModel([("session_token", ASCENDING), ("expires_at", ASCENDING)], name="session_token_expires"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        IndexModel([("revoked_at", ASCENDING)], name="revoked_at", sparse=True),
+    ],
+    "therapy_sessions": [
+        IndexModel([("user_id", ASCENDING), ("started_at", DESCENDING)], name="user_started"),
+        IndexModel([("id", ASCENDING), ("user_id", ASCENDING)], name="id_user"),
+        IndexModel([("started_at", DESCENDING)], name="started_at"),
+    ],
+    "messages": [
+        IndexModel([("session_id", ASCENDING), ("user_id", ASCENDING), ("timestamp", ASCENDING)],
+                   name="session_user_timestamp"),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_timestamp"),
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING)], name="session_timestamp"),
+        IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+    ],
+    "risk_assessments": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_timestamp"),
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("message_id", ASCENDING)], name="message_id"),
+    ],
+    "video_analyses": [
+        IndexModel([("session_id", ASCENDING), ("user_id", ASCENDING), ("timestamp", ASCENDING)],
+                   name="session_user_timestamp"),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_timestamp"),
+    ],
+    "user_profiles": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "doctor_notes": [
+        IndexModel([("patient_id", ASCENDING), ("timestamp", DESCENDING)], name="patient_timestamp"),
+    ],
+    "conversation_states": [
+        IndexModel([("updated_at", ASCENDING)], name="updated_at_ttl", expireAfterSeconds=7 * 24 * 60 * 60),
+    ],
+    "idempotency_keys": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=24 * 60 * 60),
+    ],
+    "chat_turn_preparations": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=24 * 60 * 60),
+    ],
+    "session_requests": [
+        IndexModel([("patient_id", ASCENDING), ("requested_at", DESCENDING)], name="patient_requested"),
+        IndexModel([("doctor_id", ASCENDING), ("requested_at", DESCENDING)], name="doctor_requested"),
+        IndexModel([("id", ASCENDING), ("doctor_id", ASCENDING)], name="id_doctor"),
+    ],
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Representative filter/sort shapes issued by server.py; each must be index-backed
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"collection": "user_sessions", "filter": {"session_token": "x", "expires_at": {"$gt": EPOCH}}},
+    {"collection": "user_sessions", "filter": {"revoked_at": {"$exists": True}, "expires_at": {"$gt": EPOCH}}},
+    {"collection": "user_sessions", "filter": {"revoked_at": {"$gt": EPOCH}}},
+    {"collection": "admin_sessions", "filter": {"session_token": "x", "expires_at": {"$gt": EPOCH}}},
+    {"collection": "admin_sessions", "filter": {"revoked_at": {"$gt": EPOCH}}},
+    {"collection": "users", "filter": {"user_id_number": "x"}},
+    {"collection": "users", "filter": {"auth_updated_at": {"$gt": EPOCH}}},
+    {"collection": "users", "filter": {"user_type": {"$in": ["doctor", "psychiatrist"]}, "account_status": "pending"},
+     "sort": [("created_at", DESCENDING)]},
+    {"collection": "therapy_sessions", "filter": {"user_id": "x"}, "sort": [("started_at", DESCENDING)]},
+    {"collection": "therapy_sessions", "filter": {"id": "x", "user_id": "x"}},
+    {"collection": "messages", "filter": {"session_id": "x", "user_id": "x"}, "sort": [("timestamp", ASCENDING)]},
+    {"collection": "messages", "filter": {"user_id": "x"}, "sort": [("timestamp", DESCENDING)]},
+    {"collection": "messages", "filter": {"session_id": "x"}, "sort": [("timestamp", ASCENDING)]},
+    {"collection": "risk_assessments", "filter": {"user_id": "x"}, "sort": [("timestamp", DESCENDING)]},
+    {"collection": "risk_assessments", "filter": {"id": "x"}},
+    {"collection": "risk_assessments", "filter": {"message_id": "x"}},
+    {"collection": "video_analyses", "filter": {"session_id": "x", "user_id": "x"}, "sort": [("timestamp", ASCENDING)]},
+    {"collection": "user_profiles", "filter": {"user_id": "x"}},
+    {"collection": "doctor_notes", "filter": {"patient_id": "x"}, "sort": [("timestamp", DESCENDING)]},
+    {"collection": "session_requests", "filter": {"patient_id": "x"}, "sort": [("requested_at", DESCENDING)]},
+    {"collection": "session_requests", "filter": {"doctor_id": "x"}, "sort": [("requested_at", DESCENDING)]},
+    {"collection": "session_requests", "filter": {"id": "x", "doctor_id": "x"}},
+]
+
+
+async def ensure_indexes(db) -> None:
+    """Create every registered index; safe to run on every startup"""
+    for collection, indexes in INDEX_REGISTRY.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            if e.code not in INDEX_CONFLICT_CODES:
+                raise
+            # Created earlier under a different name/options; the shape is still served
+            logger.warning(f"Index conflict on {collection}, keeping existing definition: {e}")
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    """Collect every stage name in a (possibly nested) explain plan"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def verify_query_plans(db) -> None:
+    """
+    Explain every registered query shape and fail if any falls back to COLLSCAN
+    Raises RuntimeError listing the offending shapes
+    """
+    collscans = []
+    for shape in QUERY_SHAPES:
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        explanation = await cursor.limit(1).explain()
+        winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            collscans.append(f"{shape['collection']} {shape['filter']} sort={shape.get('sort')}")
+
+    if collscans:
+        raise RuntimeError("Query shapes without index support (COLLSCAN): " + "; ".join(collscans))
+
+
+async def sweep_expired_sessions(db, compact: bool = False) -> Dict[str, int]:
+    """
+    Delete expired session rows and return the number removed per collection
+    The TTL monitor does the same roughly once a minute; the sweeper keeps the
+    working set small between passes and can compact afterwards
+    """
+    now = datetime.now(timezone.utc)
+    removed = {}
+    for collection in SESSION_COLLECTIONS:
+        result = await db[collection].delete_many({"expires_at": {"$lte": now}})
+        removed[collection] = result.deleted_count
+        if compact and result.deleted_count:
+            try:
+                await db.command("compact", collection)
+            except OperationFailure as e:
+                logger.warning(f"Compact of {collection} failed: {e}")
+    return removed
@@ -0,0 +1,112 @@
+"""
+Idempotency Module for MiraMind Professional
+Coalesces retried or double-submitted requests carrying the same Idempotency-Key
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request"""
+
+
+def request_fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Runs each (user, key) at most once while its result is retained.
+
+    Concurrent duplicates await the first execution instead of starting their
+    own; later duplicates get the stored result. Failures are not stored, so
+    a failed request can be retried with the same key. With a `collection`,
+    completed results are also written to Mongo (expired by a TTL index on
+    created_at) so a retry landing on another worker is answered too.
+    """
+
+    def __init__(self, ttl: float = 24 * 60 * 60, maxsize: int = 10000, collection=None):
+        self._completed: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+        self.collection = collection
+        self.replays = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _doc_id(scope: Tuple[str, str]) -> str:
+        return f"{scope[0]}:{scope[1]}"
+
+    async def _stored(self, scope: Tuple[str, str]) -> Optional[Tuple[str, Any]]:
+        if scope in self._completed:
+            return self._completed[scope]
+        if self.collection is None:
+            return None
+        doc = await self.collection.find_one({"_id": self._doc_id(scope)})
+        if not doc:
+            return None
+        self._completed[scope] = (doc["fingerprint"], doc["response"])
+        return self._completed[scope]
+
+    async def run(self, scope: Tuple[str, str], fingerprint: str, execute: Callable[[], Awaitable[Any]]) -> Any:
+        inflight = self._inflight.get(scope)
+        if inflight is not None:
+            if inflight[0] != fingerprint:
+                raise IdempotencyConflict(scope[1])
+            self.coalesced += 1
+            return await asyncio.shield(inflight[1])
+
+        stored = await self._stored(scope)
+        if stored is not None:
+            if stored[0] != fingerprint:
+                raise IdempotencyConflict(scope[1])
+            self.replays += 1
+            return stored[1]
+
+        # The lookup above awaited; another request may have claimed the key meanwhile
+        inflight = self._inflight.get(scope)
+        if inflight is not None:
+            return await self.run(scope, fingerprint, execute)
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark failures as retrieved even if no duplicate was waiting on them
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[scope] = (fingerprint, future)
+        try:
+            result = await execute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(scope, None)
+
+        self._completed[scope] = (fingerprint, result)
+        future.set_result(result)
+
+        if self.collection is not None:
+            try:
+                await self.collection.replace_one(
+                    {"_id": self._doc_id(scope)},
+                    {"fingerprint": fingerprint, "response": result, "created_at": datetime.now(timezone.utc)},
+                    upsert=True
+                )
+            except Exception as e:
+                logging.warning(f"Failed to persist idempotent response: {e}")
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "completed": len(self._completed),
+            "in_flight": len(self._inflight),
+            "replays": self.replays,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,229 @@
+"""
+LLM Providers Module for MiraMind Professional
+One interface for chat, streaming, vision and transcription, with the real
+Emergent/OpenAI backend and a deterministic local fake for load tests and CI
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Optional
+
+
+class LLMProvider(ABC):
+    """Everything the app asks of a model; implementations must be safe to call concurrently"""
+
+    @abstractmethod
+    async def chat(self, provider: str, model: str, system_message: str, text: str, session_id: str) -> str:
+        ...
+
+    @abstractmethod
+    def stream_chat(self, model: str, system_message: str, text: str) -> AsyncIterator[str]:
+        """An async generator of response chunks; callers aclose() it if they stop early"""
+
+    @abstractmethod
+    async def vision(self, model: str, system_message: str, prompt: str, image_path: str, session_id: str) -> str:
+        ...
+
+    @abstractmethod
+    async def transcribe(self, audio_path: str, language: str) -> str:
+        ...
+
+
+class EmergentProvider(LLMProvider):
+    """Chat and vision through emergentintegrations; streaming and Whisper through the OpenAI SDK"""
+
+    def __init__(self, llm_key: str, gemini_key: str):
+        from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
+        from openai import AsyncOpenAI
+        self._LlmChat = LlmChat
+        self._UserMessage = UserMessage
+        self._FileContent = FileContentWithMimeType
+        self.llm_key = llm_key
+        self.gemini_key = gemini_key
+        self.openai_client = AsyncOpenAI(api_key=llm_key)
+
+    async def chat(self, provider: str, model: str, system_message: str, text: str, session_id: str) -> str:
+        chat = self._LlmChat(
+            api_key=self.llm_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(provider, model)
+        return await chat.send_message(self._UserMessage(text=text))
+
+    async def stream_chat(self, model: str, system_message: str, text: str) -> AsyncIterator[str]:
+        stream = await self.openai_client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": text}
+            ],
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def vision(self, model: str, system_message: str, prompt: str, image_path: str, session_id: str) -> str:
+        chat = self._LlmChat(
+            api_key=self.gemini_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model("gemini", model)
+        return await chat.send_message(self._UserMessage(
+            text=prompt,
+            file_contents=[self._FileContent(file_path=image_path, mime_type="image/jpeg")]
+        ))
+
+    async def transcribe(self, audio_path: str, language: str) -> str:
+        with open(audio_path, "rb") as audio_file:
+            transcript = await self.openai_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                language=language
+            )
+        return transcript.text
+
+
+class FakeProviderError(RuntimeError):
+    """Injected failure from FakeProvider"""
+
+
+class LatencyModel:
+    """
+    Parsed latency spec in seconds: "fixed:0.5", "uniform:0.2,1.5",
+    "normal:0.8,0.3" (clipped at 0) or "lognormal:mu,sigma"
+    """
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip()
+        self.params = [float(p) for p in params.split(",") if p.strip()]
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0] if self.params else 0.0
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(*self.params))
+        return rng.lognormvariate(*self.params)
+
+
+class FakeProvider(LLMProvider):
+    """
+    Local stand-in with no network access. Replies are derived from the input
+    alone, and latencies and injected failures come from one seeded RNG, so a
+    run with the same seed and call order is reproducible.
+
+    `latency` maps "chat", "vision" and "transcribe" to a LatencyModel (chat
+    latency is time to first token when streaming). A `failure_rate` share of
+    calls raise FakeProviderError and a `hang_rate` share sleep `hang_seconds`
+    before answering, to exercise timeouts and breakers.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Dict[str, LatencyModel]] = None,
+        token_delay: float = 0.02,
+        failure_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        hang_seconds: float = 120.0,
+        seed: int = 0
+    ):
+        default = LatencyModel("fixed:0")
+        self.latency = {kind: (latency or {}).get(kind, default) for kind in ("chat", "vision", "transcribe")}
+        self.token_delay = token_delay
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.rng = random.Random(seed)
+        self.calls: Dict[str, int] = {"chat": 0, "vision": 0, "transcribe": 0}
+        self.failures = 0
+
+    async def _simulate(self, kind: str) -> None:
+        self.calls[kind] += 1
+        roll = self.rng.random()
+        delay = self.latency[kind].sample(self.rng)
+        if roll < self.failure_rate:
+            await asyncio.sleep(delay)
+            self.failures += 1
+            raise FakeProviderError(f"injected {kind} failure")
+        if roll < self.failure_rate + self.hang_rate:
+            delay = self.hang_seconds
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def _digest(*parts: str) -> str:
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def _reply(self, model: str, system_message: str, text: str) -> str:
+        digest = self._digest(model, system_message, text)
+        return f"[{model}] Seni duyuyorum. \"{text[:200]}\" hakkında biraz daha anlatır mısın? ({digest[:8]})"
+
+    async def chat(self, provider: str, model: str, system_message: str, text: str, session_id: str) -> str:
+        await self._simulate("chat")
+        return self._reply(model, system_message, text)
+
+    async def stream_chat(self, model: str, system_message: str, text: str) -> AsyncIterator[str]:
+        await self._simulate("chat")
+        words = self._reply(model, system_message, text).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
+
+    async def vision(self, model: str, system_message: str, prompt: str, image_path: str, session_id: str) -> str:
+        await self._simulate("vision")
+        with open(image_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        emotions = ["sakin", "kaygılı", "üzgün", "mutlu", "yorgun"]
+        return json.dumps({
+            "emotion": emotions[int(digest[:2], 16) % len(emotions)],
+            "stress_level": int(digest[2:4], 16) % 11,
+            "eye_movements": "sabit",
+            "body_language": "nötr",
+            "deception_indicators": [],
+            "psychological_state": "değerlendirme sahte sağlayıcıdan",
+            "summary": f"fake-{digest[:8]}"
+        }, ensure_ascii=False)
+
+    async def transcribe(self, audio_path: str, language: str) -> str:
+        await self._simulate("transcribe")
+        with open(audio_path, "rb") as f:
+            content = f.read()
+        return f"sahte transkript {len(content)} bayt ({hashlib.sha256(content).hexdigest()[:8]})"
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.calls, "failures": self.failures}
+
+
+def _fake_from_env(env: Dict[str, str]) -> FakeProvider:
+    default = env.get("FAKE_LLM_LATENCY", "fixed:0")
+    latency = {
+        kind: LatencyModel(env.get(f"FAKE_LLM_LATENCY_{kind.upper()}", default))
+        for kind in ("chat", "vision", "transcribe")
+    }
+    return FakeProvider(
+        latency=latency,
+        token_delay=float(env.get("FAKE_LLM_TOKEN_DELAY", "0.02")),
+        failure_rate=float(env.get("FAKE_LLM_FAILURE_RATE", "0")),
+        hang_rate=float(env.get("FAKE_LLM_HANG_RATE", "0")),
+        hang_seconds=float(env.get("FAKE_LLM_HANG_SECONDS", "120")),
+        seed=int(env.get("FAKE_LLM_SEED", "0"))
+    )
+
+
+def create_llm_provider(backend: str, env: Dict[str, str]) -> LLMProvider:
+    """Provider for LLM_BACKEND ("emergent" or "fake"), configured from the environment"""
+    if backend == "fake":
+        logging.warning("LLM_BACKEND=fake: all model calls are served by the local fake provider")
+        return _fake_from_env(env)
+    if backend != "emergent":
+        raise ValueError(f"Unknown LLM_BACKEND: {backend}")
+    return EmergentProvider(env["EMERGENT_LLM_KEY"], env["GEMINI_API_KEY"])
@@ -0,0 +1,164 @@
+"""
+LLM Scheduler Module for MiraMind Professional
+Per-provider concurrency limits with priority lanes, so bursts of background
+calls (summaries, vision) cannot starve live chat
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+# Highest priority first
+LANES = ("chat", "vision", "summary")
+
+DEFAULT_LANE_SHARE = {"chat": 1.0, "vision": 1.0, "summary": 0.5}
+DEFAULT_MAX_QUEUE = {"chat": 200, "vision": 20, "summary": 100}
+DEFAULT_QUEUE_TIMEOUT = {"chat": 15.0, "vision": 5.0, "summary": 300.0}
+
+
+class LLMOverloaded(Exception):
+    """A call was refused because its lane's queue is full or it waited too long"""
+
+    def __init__(self, provider: str, lane: str, reason: str):
+        super().__init__(f"{provider}/{lane}: {reason}")
+        self.provider = provider
+        self.lane = lane
+        self.reason = reason
+
+
+class _ProviderState:
+    def __init__(self, limit: int, lane_share: Dict[str, float]):
+        self.limit = limit
+        # A lane may hold at most this many slots; the rest stay free for higher lanes
+        self.lane_caps = {lane: max(1, int(limit * lane_share.get(lane, 1.0))) for lane in LANES}
+        self.active = 0
+        self.active_by_lane = {lane: 0 for lane in LANES}
+        self.queues: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self.counters = {lane: {"started": 0, "rejected": 0, "timed_out": 0, "peak_queue": 0, "max_wait_ms": 0.0} for lane in LANES}
+
+    def can_start(self, lane: str) -> bool:
+        return self.active < self.limit and self.active_by_lane[lane] < self.lane_caps[lane]
+
+    def start(self, lane: str) -> None:
+        self.active += 1
+        self.active_by_lane[lane] += 1
+        self.counters[lane]["started"] += 1
+
+
+class LLMScheduler:
+    """
+    Admits LLM calls per provider up to `limits[provider]` at a time.
+
+    Waiting calls are served by lane (chat, then vision, then summary) and
+    FIFO within a lane. Lower lanes are capped at a share of the provider's
+    slots so live chat always finds one soon. A call whose lane queue is full,
+    or that waits past the lane's timeout, raises LLMOverloaded instead of
+    piling up behind the provider. Providers not listed in `limits` get
+    `default_limit` slots on first use.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        lane_share: Optional[Dict[str, float]] = None,
+        max_queue: Optional[Dict[str, int]] = None,
+        queue_timeout: Optional[Dict[str, float]] = None,
+        default_limit: int = 8
+    ):
+        self._share = {**DEFAULT_LANE_SHARE, **(lane_share or {})}
+        self.default_limit = default_limit
+        self.max_queue = {**DEFAULT_MAX_QUEUE, **(max_queue or {})}
+        self.queue_timeout = {**DEFAULT_QUEUE_TIMEOUT, **(queue_timeout or {})}
+        self._providers = {name: _ProviderState(limit, self._share) for name, limit in limits.items()}
+
+    def _state(self, provider: str) -> _ProviderState:
+        state = self._providers.get(provider)
+        if state is None:
+            state = self._providers[provider] = _ProviderState(self.default_limit, self._share)
+        return state
+
+    def _dispatch(self, state: _ProviderState) -> None:
+        for lane in LANES:
+            queue = state.queues[lane]
+            while queue and state.can_start(lane):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                state.start(lane)
+                waiter.set_result(None)
+
+    def _release(self, state: _ProviderState, lane: str) -> None:
+        state.active -= 1
+        state.active_by_lane[lane] -= 1
+        self._dispatch(state)
+
+    async def _acquire(self, provider: str, lane: str) -> None:
+        state = self._state(provider)
+        counters = state.counters[lane]
+        # Start now only if nobody of the same or a higher lane is already waiting
+        ahead = any(state.queues[other] for other in LANES[:LANES.index(lane) + 1])
+        if not ahead and state.can_start(lane):
+            state.start(lane)
+            return
+
+        queue = state.queues[lane]
+        if len(queue) >= self.max_queue[lane]:
+            counters["rejected"] += 1
+            raise LLMOverloaded(provider, lane, "queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        counters["peak_queue"] = max(counters["peak_queue"], len(queue))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout[lane])
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we gave up; hand the slot on
+                self._release(state, lane)
+            else:
+                waiter.cancel()
+                try:
+                    queue.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                counters["timed_out"] += 1
+                raise LLMOverloaded(provider, lane, "queue timeout") from None
+            raise
+        finally:
+            wait_ms = (time.perf_counter() - started) * 1000
+            counters["max_wait_ms"] = round(max(counters["max_wait_ms"], wait_ms), 1)
+
+    @asynccontextmanager
+    async def slot(self, provider: str, lane: str):
+        """Hold one of the provider's slots for the duration of the block (e.g. a whole stream)"""
+        await self._acquire(provider, lane)
+        try:
+            yield
+        finally:
+            self._release(self._state(provider), lane)
+
+    async def run(self, provider: str, lane: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        async with self.slot(provider, lane):
+            return await call()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "limit": state.limit,
+                "active": state.active,
+                "lanes": {
+                    lane: {
+                        "active": state.active_by_lane[lane],
+                        "cap": state.lane_caps[lane],
+                        "queued": len(state.queues[lane]),
+                        **state.counters[lane]
+                    }
+                    for lane in LANES
+                }
+            }
+            for name, state in self._providers.items()
+        }
@@ -0,0 +1,224 @@
+"""
+Prompt Builder Module for MiraMind Professional
+Token-budgeted system prompt assembly with deterministic elision
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Rough chars-per-token ratio used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+_encoder: Any = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    """tiktoken encoder, loaded once; None if tiktoken or its BPE file is unavailable"""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logging.warning(f"tiktoken unavailable, estimating prompt tokens from length: {e}")
+            _encoder = None
+        _encoder_loaded = True
+    return _encoder
+
+
+def load_encoder() -> bool:
+    """
+    Load the tokenizer now. Blocking (a BPE file read, or a download on first
+    use), so servers call it off the event loop at startup. True if tiktoken is in use.
+    """
+    return _get_encoder() is not None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _truncate(text: str, max_tokens: int, keep: str) -> str:
+    """Cut text to max_tokens keeping its head ("head") or both ends ("middle")"""
+    marker = "\n[…kısaltıldı…]\n"
+    budget = max_tokens - count_tokens(marker)
+    if budget <= 0:
+        return ""
+
+    encoder = _get_encoder()
+    if encoder is not None:
+        tokens = encoder.encode(text)
+        if keep == "middle":
+            head = budget - budget // 2
+            return encoder.decode(tokens[:head]) + marker + encoder.decode(tokens[len(tokens) - budget // 2:])
+        return encoder.decode(tokens[:budget]) + marker
+
+    chars = budget * CHARS_PER_TOKEN
+    if keep == "middle":
+        head = chars - chars // 2
+        return text[:head] + marker + text[len(text) - chars // 2:]
+    return text[:chars] + marker
+
+
+class PromptSection:
+    """
+    One block of the system prompt.
+
+    `content` is either a string, truncated per `keep` when over budget, or a
+    list of items (oldest first) from which the oldest are dropped whole.
+    Lower `priority` is served first; `required` sections are never cut.
+    Content is tokenized once (list items one by one) and the counts reused
+    for allocation, elision and the report.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        content: Union[str, List[str]],
+        priority: int,
+        header: str = "",
+        required: bool = False,
+        keep: str = "head",
+        empty_text: Optional[str] = None
+    ):
+        self.name = name
+        self.content = content
+        self.priority = priority
+        self.header = header
+        self.required = required
+        self.keep = keep
+        self.empty_text = empty_text
+        self._measured: Optional[Tuple[str, int]] = None
+        self._header_tokens: Optional[int] = None
+        self._item_tokens: Optional[List[int]] = None
+
+    def is_empty(self) -> bool:
+        return not self.content
+
+    def header_tokens(self) -> int:
+        if self._header_tokens is None:
+            self._header_tokens = count_tokens(self.header)
+        return self._header_tokens
+
+    def item_tokens(self) -> List[int]:
+        """Tokens of each list item, plus one for the newline joining it"""
+        if self._item_tokens is None:
+            self._item_tokens = [count_tokens(item) + 1 for item in self.content]
+        return self._item_tokens
+
+    def measure(self) -> Tuple[str, int]:
+        """The full rendering and its token count"""
+        if self._measured is None:
+            text = self.render_full()
+            if self.is_empty() or not isinstance(self.content, list):
+                tokens = count_tokens(text)
+            else:
+                tokens = self.header_tokens() + sum(self.item_tokens()) - 1
+            self._measured = (text, tokens)
+        return self._measured
+
+    def render_full(self) -> str:
+        if self.is_empty():
+            return self.empty_text or ""
+        body = "\n".join(self.content) if isinstance(self.content, list) else self.content
+        return self.header + body
+
+    def render_within(self, max_tokens: int) -> Dict[str, Any]:
+        full, full_tokens = self.measure()
+        if self.required or full_tokens <= max_tokens:
+            return {"text": full, "tokens": full_tokens, "elided_items": 0, "truncated": False}
+
+        if isinstance(self.content, list):
+            # Keep the newest items that fit, with a note saying how many were dropped
+            kept: List[str] = []
+            used = self.header_tokens()
+            for item, item_tokens in zip(reversed(self.content), reversed(self.item_tokens())):
+                if used + item_tokens + 12 > max_tokens:
+                    break
+                kept.append(item)
+                used += item_tokens
+            elided = len(self.content) - len(kept)
+            if not kept:
+                return {"text": "", "tokens": 0, "elided_items": elided, "truncated": True}
+            note = f"[… {elided} önceki kayıt atlandı]"
+            return {
+                "text": self.header + "\n".join([note] + kept[::-1]),
+                "tokens": used + count_tokens(note) + 1,
+                "elided_items": elided,
+                "truncated": True
+            }
+
+        body = _truncate(self.content, max_tokens - self.header_tokens(), self.keep)
+        # _truncate fills its budget, marker included
+        return {
+            "text": self.header + body if body else "",
+            "tokens": max_tokens if body else 0,
+            "elided_items": 0,
+            "truncated": True
+        }
+
+
+class PromptAssembly:
+    def __init__(self, text: str, budget: int, sections: Dict[str, Dict[str, Any]], total_tokens: int):
+        self.text = text
+        self.budget = budget
+        self.sections = sections
+        self.total_tokens = total_tokens
+
+    def report(self) -> Dict[str, Any]:
+        return {"budget": self.budget, "total_tokens": self.total_tokens, "sections": self.sections}
+
+
+def assemble_prompt(sections: List[PromptSection], budget: int) -> PromptAssembly:
+    """
+    Allocate `budget` tokens across sections by priority and render them in
+    the given order. Allocation and elision depend only on the inputs, so the
+    same history always yields the same prompt.
+    """
+    remaining = budget
+    allocation: Dict[str, int] = {}
+    for section in sorted(sections, key=lambda s: s.priority):
+        need = section.measure()[1]
+        granted = need if section.required else min(need, max(remaining, 0))
+        allocation[section.name] = granted
+        remaining -= granted
+
+    parts = []
+    report = {}
+    total_tokens = 0
+    for section in sections:
+        rendered = section.render_within(allocation[section.name])
+        if rendered["text"]:
+            parts.append(rendered["text"])
+            total_tokens += rendered["tokens"]
+        report[section.name] = {
+            "tokens": rendered["tokens"],
+            "elided_items": rendered["elided_items"],
+            "truncated": rendered["truncated"]
+        }
+
+    # Sections are joined by a blank line, about one token each
+    total_tokens += max(len(parts) - 1, 0)
+    return PromptAssembly("\n\n".join(parts), budget, report, total_tokens)
+
+
+def dedupe_history(messages: List[Dict[str, Any]], exclude_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Drop repeated message ids and the message being answered, which the LLM
+    already receives as the user turn
+    """
+    seen = set()
+    unique = []
+    for msg in messages:
+        msg_id = msg.get("id")
+        if msg_id is not None and (msg_id == exclude_id or msg_id in seen):
+            continue
+        seen.add(msg_id)
+        unique.append(msg)
+    return unique
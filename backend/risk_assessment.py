@@ -4,7 +4,7 @@ Analyzes messages for crisis, self-harm, and suicide risk
 """
 
 import re
-from typing import Dict, List, Tuple
+from typing import Dict, FrozenSet, Iterable, List
 
 # Crisis keywords - Türkçe
 SUICIDE_KEYWORDS = [
@@ -27,12 +27,70 @@ CRISIS_KEYWORDS = [
     "çaresizim", "yalnızım", "umutsuzum"
 ]
 
+# (keywords, flag set on a match, indicator label, points per keyword), in scoring order
+RISK_LEXICONS = [
+    (SUICIDE_KEYWORDS, "suicide_risk", "İntihar göstergesi", 4),
+    (SELF_HARM_KEYWORDS, "self_harm_risk", "Kendine zarar göstergesi", 3),
+    (HIGH_RISK_KEYWORDS, None, "Yüksek risk göstergesi", 5),
+    (CRISIS_KEYWORDS, "crisis_detected", "Kriz göstergesi", 2)
+]
+
+# Negative emotion phrases, +1 each; whitespace is collapsed by normalization,
+# so these are plain keywords like the others
+NEGATIVE_PHRASES = [
+    "hiçbir şey", "kimse anlamıyor", "artık yok", "sonsuza kadar"
+]
+
+# risk_category values, lowest first
+RISK_TIERS = ("low", "medium", "high", "critical")
+
+# After str.lower(): "I" is already "i", and "İ" is "i" + a combining dot
+_DIACRITIC_FOLDS = [
+    ("ç", "c"), ("ğ", "g"), ("ı", "i"), ("ö", "o"), ("ş", "s"), ("ü", "u"),
+    ("â", "a"), ("î", "i"), ("û", "u"), ("\u0307", "")
+]
+# Keywords are plain ASCII once folded, so anything else only separates words
+_SEPARATOR_RUN = re.compile(r"[^a-z0-9]+")
+_REPEATED_CHAR = re.compile(r"(.)\1+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Matching form shared by every lexicon and message: Turkish casefold,
+    diacritics folded to ASCII, punctuation and whitespace runs collapsed to
+    one space, repeated letters squeezed ("ÖLMEEEK İSTİYORUM!!" -> "olmek istiyorum ")
+    """
+    text = text.lower()
+    if not text.isascii():
+        for accented, plain in _DIACRITIC_FOLDS:
+            text = text.replace(accented, plain)
+    return _REPEATED_CHAR.sub(r"\1", _SEPARATOR_RUN.sub(" ", text))
+
+
+# Every keyword in matching form, normalized once at import
+NORMALIZED_KEYWORDS = {
+    keyword: normalize_text(keyword)
+    for keyword in (
+        [keyword for keywords, _, _, _ in RISK_LEXICONS for keyword in keywords]
+        + NEGATIVE_PHRASES
+    )
+}
+# Distinct forms to look for; a few dozen substring scans cost a fraction of normalizing the message
+_MATCH_KEYWORDS = tuple(dict.fromkeys(NORMALIZED_KEYWORDS.values()))
+
+
+def match_keywords(message: str) -> FrozenSet[str]:
+    """Normalized keywords occurring in the message (overlapping and nested ones included)"""
+    text = normalize_text(message)
+    return frozenset(keyword for keyword in _MATCH_KEYWORDS if keyword in text)
+
+
 def analyze_message_risk(message: str) -> Dict:
     """
     Analyze a message for risk indicators
     Returns risk assessment dict
     """
-    message_lower = message.lower()
+    found = match_keywords(message)
     
     # Initialize risk assessment
     risk = {
@@ -44,43 +102,19 @@ def analyze_message_risk(message: str) -> Dict:
         "risk_indicators": []
     }
     
-    # Check suicide keywords
-    for keyword in SUICIDE_KEYWORDS:
-        if keyword in message_lower:
-            risk["suicide_risk"] = True
-            risk["risk_indicators"].append(f"İntihar göstergesi: '{keyword}'")
-            risk["risk_level"] += 4
-    
-    # Check self-harm keywords
-    for keyword in SELF_HARM_KEYWORDS:
-        if keyword in message_lower:
-            risk["self_harm_risk"] = True
-            risk["risk_indicators"].append(f"Kendine zarar göstergesi: '{keyword}'")
-            risk["risk_level"] += 3
-    
-    # Check high risk keywords
-    for keyword in HIGH_RISK_KEYWORDS:
-        if keyword in message_lower:
-            risk["risk_indicators"].append(f"Yüksek risk göstergesi: '{keyword}'")
-            risk["risk_level"] += 5
-    
-    # Check crisis keywords
-    for keyword in CRISIS_KEYWORDS:
-        if keyword in message_lower:
-            risk["crisis_detected"] = True
-            risk["risk_indicators"].append(f"Kriz göstergesi: '{keyword}'")
-            risk["risk_level"] += 2
+    # Keyword hits, scored per lexicon in list order (a keyword listed twice counts twice)
+    if found:
+        for keywords, flag, label, points in RISK_LEXICONS:
+            for keyword in keywords:
+                if NORMALIZED_KEYWORDS[keyword] in found:
+                    if flag:
+                        risk[flag] = True
+                    risk["risk_indicators"].append(f"{label}: '{keyword}'")
+                    risk["risk_level"] += points
     
     # Negative emotion patterns
-    negative_patterns = [
-        r'hiçbir\s+şey',
-        r'kimse\s+anlamıyor',
-        r'artık\s+yok',
-        r'sonsuza\s+kadar'
-    ]
-    
-    for pattern in negative_patterns:
-        if re.search(pattern, message_lower):
+    for phrase in NEGATIVE_PHRASES:
+        if NORMALIZED_KEYWORDS[phrase] in found:
             risk["risk_level"] += 1
     
     # Cap risk level at 10
@@ -99,6 +133,19 @@ def analyze_message_risk(message: str) -> Dict:
     return risk
 
 
+def score_messages(messages: Iterable[str]) -> List[Dict]:
+    """
+    Batch entry point: analyze_message_risk for each message, in order.
+    Module-level so a process pool can pickle it (see risk_backfill.py).
+    """
+    return [analyze_message_risk(message) for message in messages]
+
+
+def max_risk_category(categories: Iterable[str]) -> str:
+    """Highest of the given risk categories ("low" when there are none)"""
+    return RISK_TIERS[max((RISK_TIERS.index(c) for c in categories if c in RISK_TIERS), default=0)]
+
+
 def should_notify_doctor(risk: Dict) -> bool:
     """Determine if doctor should be notified"""
     return risk["risk_category"] in ["critical", "high"] or risk["suicide_risk"]
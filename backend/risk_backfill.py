@@ -0,0 +1,184 @@
+"""
+Risk Backfill Job for MiraMind Professional
+Re-scores historical user messages with the current lexicons and rewrites
+their risk_assessments rows
+
+Streams `messages` (role=user) in _id order, scores chunks in a process pool
+and upserts results with unordered bulk_write, keyed by message_id. Progress
+is checkpointed per job after every written chunk, so an interrupted run
+(or an expired cursor) resumes where it stopped when started again.
+
+    python risk_backfill.py [--job rescore] [--chunk-size 1000] [--workers 4]
+                            [--limit N] [--restart] [--dry-run]
+"""
+
+import argparse
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+from db_maintenance import INDEX_REGISTRY
+from risk_assessment import score_messages
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger("risk_backfill")
+
+MESSAGE_PROJECTION = {"_id": 1, "id": 1, "user_id": 1, "session_id": 1, "content": 1, "timestamp": 1}
+
+
+def iter_chunks(cursor, size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def assessment_updates(chunk: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[UpdateOne]:
+    now = datetime.now(timezone.utc)
+    updates = []
+    for doc, risk in zip(chunk, results):
+        if not doc.get("id"):
+            continue
+        updates.append(UpdateOne(
+            {"message_id": doc["id"]},
+            {
+                "$set": {
+                    "risk_level": risk["risk_level"],
+                    "risk_category": risk["risk_category"],
+                    "risk_indicators": risk["risk_indicators"],
+                    "suicide_risk": risk["suicide_risk"],
+                    "self_harm_risk": risk["self_harm_risk"],
+                    "crisis_detected": risk["crisis_detected"],
+                    "rescored_at": now
+                },
+                # Rows created by the backfill never notified anyone
+                "$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "user_id": doc.get("user_id"),
+                    "session_id": doc.get("session_id"),
+                    "doctor_notified": False,
+                    "timestamp": doc.get("timestamp", now)
+                }
+            },
+            upsert=True
+        ))
+    return updates
+
+
+class Backfill:
+    def __init__(self, db, job: str, dry_run: bool):
+        self.db = db
+        self.job = job
+        self.dry_run = dry_run
+        self.processed = 0
+        self.written = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed else 0.0
+
+    def commit(self, chunk: List[Dict[str, Any]], future: Future, report_every: float) -> None:
+        results = future.result()
+        updates = assessment_updates(chunk, results)
+        if updates and not self.dry_run:
+            result = self.db.risk_assessments.bulk_write(updates, ordered=False)
+            self.written += result.upserted_count + result.modified_count
+        self.processed += len(chunk)
+
+        if not self.dry_run:
+            # Only after the chunk's writes landed, so a resume never skips unwritten messages
+            self.db.risk_backfill_checkpoints.update_one(
+                {"_id": self.job},
+                {
+                    "$set": {"last_id": chunk[-1]["_id"], "updated_at": datetime.now(timezone.utc)},
+                    "$inc": {"processed": len(chunk)}
+                },
+                upsert=True
+            )
+
+        now = time.monotonic()
+        if now - self.last_report >= report_every:
+            self.last_report = now
+            logger.info(f"{self.processed} messages, {self.written} rows written, {self.rate():.0f} msg/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--job", default="rescore", help="checkpoint name; separate jobs resume independently")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many messages (0 = all)")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint and start from the beginning")
+    parser.add_argument("--dry-run", action="store_true", help="score without writing rows or checkpoints")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    client = MongoClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    # The upserts look rows up by message_id
+    db.risk_assessments.create_indexes(INDEX_REGISTRY["risk_assessments"])
+
+    query: Dict[str, Any] = {"role": "user"}
+    checkpoint = None if args.restart else db.risk_backfill_checkpoints.find_one({"_id": args.job})
+    if checkpoint and checkpoint.get("last_id") is not None:
+        query["_id"] = {"$gt": checkpoint["last_id"]}
+        logger.info(f"Resuming job '{args.job}' after {checkpoint['last_id']} ({checkpoint.get('processed', 0)} done before)")
+    elif not args.dry_run:
+        db.risk_backfill_checkpoints.replace_one(
+            {"_id": args.job},
+            {"processed": 0, "started_at": datetime.now(timezone.utc)},
+            upsert=True
+        )
+
+    cursor = db.messages.find(query, MESSAGE_PROJECTION).sort("_id", 1).batch_size(args.chunk_size)
+    if args.limit:
+        cursor = cursor.limit(args.limit)
+
+    backfill = Backfill(db, args.job, args.dry_run)
+    # Bounded in-flight chunks keep memory flat however large the collection is
+    max_in_flight = max(1, args.workers) * 2
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            in_flight: "deque[tuple]" = deque()
+            for chunk in iter_chunks(cursor, args.chunk_size):
+                in_flight.append((chunk, pool.submit(score_messages, [doc.get("content") or "" for doc in chunk])))
+                if len(in_flight) >= max_in_flight:
+                    backfill.commit(*in_flight.popleft(), args.report_every)
+            while in_flight:
+                backfill.commit(*in_flight.popleft(), args.report_every)
+        if not args.dry_run and not args.limit:
+            db.risk_backfill_checkpoints.update_one(
+                {"_id": args.job},
+                {"$set": {"finished_at": datetime.now(timezone.utc)}}
+            )
+    finally:
+        cursor.close()
+        client.close()
+
+    logger.info(
+        f"Done: {backfill.processed} messages, {backfill.written} rows written in "
+        f"{time.monotonic() - backfill.started:.1f}s ({backfill.rate():.0f} msg/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Cookie, UploadFile, File
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Cookie, UploadFile, File, Depends, WebSocket, WebSocketDisconnect
+from starlette.requests import HTTPConnection
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -7,15 +8,27 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable
 import uuid
 from datetime import datetime, timezone, timedelta
 import asyncio
 import base64
-from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
-import httpx
-from openai import AsyncOpenAI
-from risk_assessment import analyze_message_risk, should_notify_doctor, generate_crisis_response
+import json
+import time
+from risk_assessment import analyze_message_risk, should_notify_doctor, generate_crisis_response, max_risk_category, RISK_TIERS
+from auth_cache import SessionCache
+from cachetools import TTLCache
+from conversation_window import ConversationWindows, PersistentConversationWindows
+from prompt_builder import PromptSection, assemble_prompt, dedupe_history, load_encoder
+from idempotency import IdempotencyStore, IdempotencyConflict, request_fingerprint
+from session_tokens import issue_session_token, verify_session_token, is_signed_token
+from db_maintenance import ensure_indexes, verify_query_plans, sweep_expired_sessions
+from auth_client import EmergentAuthClient, AuthServiceError
+from write_behind import WriteBehindBuffer
+from llm_scheduler import LLMScheduler, LLMOverloaded
+from settings_cache import SettingsCache
+from circuit_breaker import CircuitBreakers, ProviderUnavailable, guarded_call, hedged_call
+from llm_providers import create_llm_provider
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -29,12 +42,43 @@ db = client[os.environ['DB_NAME']]
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
-# API Keys
-EMERGENT_LLM_KEY = os.environ['EMERGENT_LLM_KEY']
-GEMINI_API_KEY = os.environ['GEMINI_API_KEY']
+# Model backend: "emergent" (Emergent LLM key + Gemini, OpenAI SDK for streaming and Whisper)
+# or "fake" (local, deterministic; for load tests and CI, see llm_providers.FakeProvider)
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'emergent')
+llm = create_llm_provider(LLM_BACKEND, os.environ)
+
+# Every LLM call takes a slot here; live chat (and its transcription) is served before vision and summaries
+llm_scheduler = LLMScheduler(
+    limits={
+        "openai": int(os.environ.get('LLM_CONCURRENCY_OPENAI', '32')),
+        "gemini": int(os.environ.get('LLM_CONCURRENCY_GEMINI', '8')),
+        "whisper": int(os.environ.get('LLM_CONCURRENCY_WHISPER', '8'))
+    },
+    lane_share={"summary": float(os.environ.get('LLM_SUMMARY_SHARE', '0.5'))}
+)
+LLM_RETRY_AFTER = int(os.environ.get('LLM_RETRY_AFTER', '5'))
 
-# OpenAI client for Whisper
-openai_client = AsyncOpenAI(api_key=EMERGENT_LLM_KEY)
+# Breakers per provider/model; open circuits fail fast instead of holding the request for the full timeout
+llm_breakers = CircuitBreakers(
+    failure_rate=float(os.environ.get('LLM_BREAKER_FAILURE_RATE', '0.5')),
+    slow_call_seconds=float(os.environ.get('LLM_SLOW_CALL_SECONDS', '20')),
+    open_seconds=float(os.environ.get('LLM_BREAKER_OPEN_SECONDS', '30'))
+)
+LLM_CALL_TIMEOUT = float(os.environ.get('LLM_CALL_TIMEOUT', '45'))
+# Longest gap between streamed chunks before the stream counts as stalled
+LLM_STREAM_CHUNK_TIMEOUT = float(os.environ.get('LLM_STREAM_CHUNK_TIMEOUT', '20'))
+# Hedge after the primary model's p95, within these bounds; the default applies until there are enough samples
+LLM_HEDGE_MIN_DELAY = float(os.environ.get('LLM_HEDGE_MIN_DELAY', '1'))
+LLM_HEDGE_DEFAULT_DELAY = float(os.environ.get('LLM_HEDGE_DEFAULT_DELAY', '8'))
+
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded):
+    logging.warning(f"LLM call refused: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Sistem şu anda yoğun, lütfen tekrar deneyin"},
+        headers={"Retry-After": str(LLM_RETRY_AFTER)}
+    )
 
 # ============= MODELS =============
 
@@ -106,6 +150,8 @@ class UserProfile(BaseModel):
     triggers: List[str] = []  # Tetikleyiciler
     coping_strategies: List[str] = []  # Başa çıkma stratejileri
     session_summaries: List[Dict[str, Any]] = []  # Her seans özeti
+    profile_context: Optional[str] = None  # Sohbet için hazır RAG bağlamı
+    profile_context_version: int = 0  # profile_context her yeniden oluşturulduğunda artar
     last_updated: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -138,6 +184,7 @@ class AISettings(BaseModel):
     chat_model: str = "gpt-5"
     chat_provider: str = "openai"
     vision_model: str = "gemini-2.5-pro"
+    fallback_chat_model: Optional[str] = None  # Hedge target when chat_model is slow; None disables hedging
     tts_voice: str = "nova"
     tts_model: str = "tts-1"
     system_prompt: str
@@ -187,6 +234,27 @@ class DoctorNote(BaseModel):
     tags: List[str] = []
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Built-in AI settings, used until an admin saves their own
+DEFAULT_AI_SETTINGS = {
+    "chat_model": "gpt-5",
+    "chat_provider": "openai",
+    "vision_model": "gemini-2.5-pro",
+    "fallback_chat_model": None,
+    "tts_voice": "nova",
+    "tts_model": "tts-1",
+    "system_prompt": "Sen MiraMind'sın, empatik ve profesyonel bir psikolojik destek asistanısın.",
+    "max_message_length": 2000,
+    "enable_video_analysis": True,
+    "enable_tts": True
+}
+
+# Read by the chat, summary and vision paths on every call; never hits the database
+ai_settings = SettingsCache(
+    db.ai_settings,
+    DEFAULT_AI_SETTINGS,
+    poll_interval=float(os.environ.get('AI_SETTINGS_POLL_INTERVAL', '5'))
+)
+
 # ============= AUTH HELPERS =============
 
 # Admin credentials from environment
@@ -194,8 +262,109 @@ ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@berkai.com')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'MiraMind2025!')
 AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'https://demobackend.emergentagent.com')
 
-async def get_current_user(request: Request) -> Optional[User]:
-    """Get current user from session token in cookie or Authorization header"""
+# One pooled client for the app lifetime so sign-ins reuse TCP/TLS connections
+emergent_auth = EmergentAuthClient(
+    AUTH_SERVICE_URL,
+    connect_timeout=float(os.environ.get('AUTH_SERVICE_CONNECT_TIMEOUT', '3')),
+    read_timeout=float(os.environ.get('AUTH_SERVICE_READ_TIMEOUT', '10')),
+    max_retries=int(os.environ.get('AUTH_SERVICE_MAX_RETRIES', '2'))
+)
+
+# Resolved session tokens, so repeat requests skip the two Mongo round trips.
+# Logouts and user changes on other workers reach it through revocation_sync_loop
+user_session_cache = SessionCache(
+    maxsize=int(os.environ.get('USER_SESSION_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('USER_SESSION_CACHE_TTL', '60'))
+)
+
+# Optional signed-token mode: when a secret is configured, new sessions get
+# HMAC tokens that are verified in-process instead of looked up in Mongo
+SESSION_SIGNING_SECRET = os.environ.get('SESSION_SIGNING_SECRET')
+# Also bounds how long other workers serve a cached session after logout or a user change
+REVOCATION_SYNC_INTERVAL = float(os.environ.get('REVOCATION_SYNC_INTERVAL', '10'))
+
+# Session ids of signed tokens revoked before expiry, synced from user_sessions
+revoked_session_ids: set = set()
+
+# Start of the last revocation sync; the caches are empty before the first one
+revocation_synced_at = datetime.now(timezone.utc)
+
+# Long-running tasks started at startup and cancelled at shutdown
+background_tasks: List[asyncio.Task] = []
+
+async def sync_revoked_sessions() -> None:
+    """Reload the revocation set from user_sessions"""
+    global revoked_session_ids
+    revoked = await db.user_sessions.find(
+        {"revoked_at": {"$exists": True}, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        {"_id": 0, "id": 1}
+    ).to_list(None)
+    revoked_session_ids = {doc["id"] for doc in revoked if doc.get("id")}
+
+async def sync_cache_invalidations() -> None:
+    """Drop tokens logged out and users changed on other workers from the local caches"""
+    global revocation_synced_at
+    started = datetime.now(timezone.utc)
+    # One interval of overlap absorbs clock skew between workers; invalidating twice is harmless
+    since = revocation_synced_at - timedelta(seconds=REVOCATION_SYNC_INTERVAL)
+    revoked_admins = await db.admin_sessions.find(
+        {"revoked_at": {"$gt": since}},
+        {"_id": 0, "session_token": 1}
+    ).to_list(None)
+    for doc in revoked_admins:
+        admin_session_cache.invalidate(doc["session_token"])
+    revoked_users = await db.user_sessions.find(
+        {"revoked_at": {"$gt": since}},
+        {"_id": 0, "session_token": 1}
+    ).to_list(None)
+    for doc in revoked_users:
+        user_session_cache.invalidate(doc["session_token"])
+    changed = await db.users.find({"auth_updated_at": {"$gt": since}}, {"_id": 1}).to_list(None)
+    if changed:
+        changed_ids = {doc["_id"] for doc in changed}
+        user_session_cache.invalidate_where(lambda auth: auth.user.id in changed_ids)
+    revocation_synced_at = started
+
+async def revocation_sync_loop() -> None:
+    while True:
+        try:
+            if SESSION_SIGNING_SECRET:
+                await sync_revoked_sessions()
+            await sync_cache_invalidations()
+        except Exception as e:
+            logging.error(f"Revocation sync failed: {e}")
+        await asyncio.sleep(REVOCATION_SYNC_INTERVAL)
+
+DOCTOR_TYPES = frozenset(["doctor", "psychiatrist"])
+
+class AuthContext:
+    """Principal resolved once per request, with role flags precomputed"""
+    __slots__ = ("user", "is_doctor", "is_patient", "assigned_patient_ids")
+
+    def __init__(self, user: User):
+        self.user = user
+        self.is_doctor = user.user_type in DOCTOR_TYPES
+        self.is_patient = user.user_type == "patient"
+        # frozenset for O(1) "is this my patient" checks on doctor routes
+        self.assigned_patient_ids = frozenset(str(pid) for pid in user.assigned_patients)
+
+async def invalidate_user_cache(*user_ids: str) -> None:
+    """Drop cached sessions of users whose document changed, here and (via the sync loop) on other workers"""
+    targets = set(user_ids)
+    user_session_cache.invalidate_where(lambda auth: auth.user.id in targets)
+    await db.users.update_many(
+        {"_id": {"$in": list(targets)}},
+        {"$set": {"auth_updated_at": datetime.now(timezone.utc)}}
+    )
+
+async def resolve_auth(request: HTTPConnection) -> Optional[AuthContext]:
+    """Resolve the session token in cookie or Authorization header, once per request"""
+    if hasattr(request.state, "auth"):
+        return request.state.auth
+    request.state.auth = await _resolve_session_token(request)
+    return request.state.auth
+
+async def _resolve_session_token(request: HTTPConnection) -> Optional[AuthContext]:
     session_token = request.cookies.get("session_token")
     
     if not session_token:
@@ -206,21 +375,71 @@ async def get_current_user(request: Request) -> Optional[User]:
     if not session_token:
         return None
     
-    session = await db.user_sessions.find_one({
-        "session_token": session_token,
-        "expires_at": {"$gt": datetime.now(timezone.utc)}
-    })
+    claims = None
+    if SESSION_SIGNING_SECRET and is_signed_token(session_token):
+        # Signature, expiry and revocation are all checked without I/O
+        claims = verify_session_token(SESSION_SIGNING_SECRET, session_token)
+        if not claims or claims["sid"] in revoked_session_ids:
+            user_session_cache.invalidate(session_token)
+            return None
+    
+    cached_auth = user_session_cache.get(session_token)
+    if cached_auth is not None:
+        return cached_auth
+    
+    if claims:
+        user_id = claims["uid"]
+        expires_at = claims["expires_at"]
+    else:
+        session = await db.user_sessions.find_one({
+            "session_token": session_token,
+            "expires_at": {"$gt": datetime.now(timezone.utc)},
+            "revoked_at": {"$exists": False}
+        })
+        
+        if not session:
+            return None
+        user_id = session["user_id"]
+        expires_at = session["expires_at"]
     
-    if not session:
+    user_doc = await db.users.find_one({"_id": user_id})
+    if not user_doc:
         return None
-    
-    user_doc = await db.users.find_one({"_id": session["user_id"]})
-    if user_doc:
-        return User(**user_doc)
-    return None
+    auth = AuthContext(User(**user_doc))
+    # A signed token carries the role it was issued for; one that no longer matches is stale
+    if claims and auth.user.user_type != claims["role"]:
+        return None
+    user_session_cache.set(session_token, auth, expires_at)
+    return auth
 
-async def verify_admin(request: Request) -> bool:
-    """Verify admin access"""
+async def get_current_user(request: Request) -> Optional[User]:
+    """Get current user from session token in cookie or Authorization header"""
+    auth = await resolve_auth(request)
+    return auth.user if auth else None
+
+async def require_user(request: Request) -> AuthContext:
+    """Dependency: any authenticated user"""
+    auth = await resolve_auth(request)
+    if not auth:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return auth
+
+async def require_doctor(request: Request) -> AuthContext:
+    """Dependency: authenticated doctor or psychiatrist"""
+    auth = await resolve_auth(request)
+    if not auth or not auth.is_doctor:
+        raise HTTPException(status_code=403, detail="Only doctors can access")
+    return auth
+
+# Admin tokens resolved to the admin identity; the dashboard fires several calls per page.
+# Logouts on other workers reach it through revocation_sync_loop
+admin_session_cache = SessionCache(
+    maxsize=int(os.environ.get('ADMIN_SESSION_CACHE_SIZE', '1000')),
+    ttl=float(os.environ.get('ADMIN_SESSION_CACHE_TTL', '300'))
+)
+
+async def get_current_admin(request: Request) -> Optional[Dict[str, Any]]:
+    """Get admin identity from admin token in cookie or Authorization header"""
     admin_token = request.cookies.get("admin_token")
     
     if not admin_token:
@@ -229,22 +448,34 @@ async def verify_admin(request: Request) -> bool:
             admin_token = auth_header.replace("Bearer ", "")
     
     if not admin_token:
-        return False
+        return None
+    
+    cached_admin = admin_session_cache.get(admin_token)
+    if cached_admin is not None:
+        return cached_admin
     
     admin_session = await db.admin_sessions.find_one({
         "session_token": admin_token,
-        "expires_at": {"$gt": datetime.now(timezone.utc)}
+        "expires_at": {"$gt": datetime.now(timezone.utc)},
+        "revoked_at": {"$exists": False}
     })
     
-    return admin_session is not None
+    if not admin_session:
+        return None
+    
+    admin = {"email": admin_session.get("email", ADMIN_EMAIL)}
+    admin_session_cache.set(admin_token, admin, admin_session["expires_at"])
+    return admin
+
+async def verify_admin(request: Request) -> bool:
+    """Verify admin access"""
+    return await get_current_admin(request) is not None
 
 # ============= AUTH ROUTES =============
 
 @api_router.get("/auth/me")
-async def get_me(request: Request):
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def get_me(request: Request, auth: AuthContext = Depends(require_user)):
+    user = auth.user
     return user
 
 @api_router.post("/auth/session")
@@ -258,16 +489,14 @@ async def create_session_from_emergent(request: Request, response: Response):
         raise HTTPException(status_code=400, detail="session_id required")
     
     # Get user data from Emergent Auth
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"{AUTH_SERVICE_URL}/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id}
-        )
-        
-        if resp.status_code != 200:
-            raise HTTPException(status_code=400, detail="Invalid session_id")
-        
-        user_data = resp.json()
+    try:
+        user_data = await emergent_auth.get_session_data(session_id)
+    except AuthServiceError as e:
+        logging.error(f"Auth service unavailable: {e}")
+        raise HTTPException(status_code=502, detail="Auth service unavailable")
+    
+    if not user_data:
+        raise HTTPException(status_code=400, detail="Invalid session_id")
     
     # Check if user exists
     existing_user = await db.users.find_one({"_id": user_data["email"]})
@@ -328,12 +557,20 @@ async def create_session_from_emergent(request: Request, response: Response):
                 }
     
     # Create session for approved users
-    session_token = f"berkai_session_{uuid.uuid4()}"
+    user_session_id = str(uuid.uuid4())
+    expires_at = datetime.now(timezone.utc) + timedelta(days=7)
+    if SESSION_SIGNING_SECRET:
+        role = existing_user.get("user_type", user_type) if existing_user else user_type
+        session_token = issue_session_token(
+            SESSION_SIGNING_SECRET, user_session_id, user_data["email"], role, expires_at
+        )
+    else:
+        session_token = f"berkai_session_{uuid.uuid4()}"
     session_doc = {
-        "id": str(uuid.uuid4()),
+        "id": user_session_id,
         "user_id": user_data["email"],
         "session_token": session_token,
-        "expires_at": datetime.now(timezone.utc) + timedelta(days=7),
+        "expires_at": expires_at,
         "created_at": datetime.now(timezone.utc)
     }
     await db.user_sessions.insert_one(session_doc)
@@ -357,7 +594,17 @@ async def logout(request: Request, response: Response):
     if user:
         session_token = request.cookies.get("session_token")
         if session_token:
-            await db.user_sessions.delete_many({"session_token": session_token})
+            claims = None
+            if SESSION_SIGNING_SECRET and is_signed_token(session_token):
+                claims = verify_session_token(SESSION_SIGNING_SECRET, session_token)
+            # Keep the row until expiry so other workers pick up the revocation
+            await db.user_sessions.update_many(
+                {"session_token": session_token},
+                {"$set": {"revoked_at": datetime.now(timezone.utc)}}
+            )
+            if claims:
+                revoked_session_ids.add(claims["sid"])
+            user_session_cache.invalidate(session_token)
     
     response.delete_cookie("session_token", path="/")
     return {"success": True}
@@ -365,23 +612,20 @@ async def logout(request: Request, response: Response):
 # ============= THERAPY SESSION ROUTES =============
 
 @api_router.get("/sessions")
-async def get_user_sessions(request: Request):
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def get_user_sessions(request: Request, auth: AuthContext = Depends(require_user)):
+    user = auth.user
     
+    # risk_summary is clinician-facing; patients never see their own aggregates
     sessions = await db.therapy_sessions.find(
         {"user_id": user.id},
-        {"_id": 0}
+        {"_id": 0, "risk_summary": 0}
     ).sort("started_at", -1).to_list(100)
     
     return sessions
 
 @api_router.post("/sessions")
-async def create_therapy_session(request: Request, session_name: str = "Nueva sesión"):
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def create_therapy_session(request: Request, session_name: str = "Nueva sesión", auth: AuthContext = Depends(require_user)):
+    user = auth.user
     
     session = TherapySession(
         user_id=user.id,
@@ -394,14 +638,12 @@ async def create_therapy_session(request: Request, session_name: str = "Nueva se
     return session
 
 @api_router.get("/sessions/{session_id}")
-async def get_session(request: Request, session_id: str):
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def get_session(request: Request, session_id: str, auth: AuthContext = Depends(require_user)):
+    user = auth.user
     
     session = await db.therapy_sessions.find_one(
         {"id": session_id, "user_id": user.id},
-        {"_id": 0}
+        {"_id": 0, "risk_summary": 0}
     )
     
     if not session:
@@ -410,10 +652,8 @@ async def get_session(request: Request, session_id: str):
     return session
 
 @api_router.patch("/sessions/{session_id}/complete")
-async def complete_session(request: Request, session_id: str):
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def complete_session(request: Request, session_id: str, auth: AuthContext = Depends(require_user)):
+    user = auth.user
     
     data = await request.json()
     
@@ -447,13 +687,15 @@ Lütfen şunları belirt:
 KISA VE ÖZ YAZ. Sadece ÖNEMLİ bilgileri çıkar."""
 
         try:
-            chat = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=f"summary_{session_id}",
-                system_message="Sen bir terapi seansı analiz uzmanısın. Seanslardan önemli bilgileri çıkarıp kısa özetler hazırlarsın."
-            ).with_model("openai", "gpt-5")
-            
-            ai_summary = await chat.send_message(UserMessage(text=summary_prompt))
+            settings = ai_settings.current
+            async with llm_scheduler.slot(settings["chat_provider"], "summary"):
+                ai_summary = await llm.chat(
+                    settings["chat_provider"],
+                    settings["chat_model"],
+                    "Sen bir terapi seansı analiz uzmanısın. Seanslardan önemli bilgileri çıkarıp kısa özetler hazırlarsın.",
+                    summary_prompt,
+                    session_id=f"summary_{session_id}"
+                )
             session_summary = ai_summary
         except Exception as e:
             logging.error(f"Failed to generate session summary: {e}")
@@ -476,7 +718,7 @@ KISA VE ÖZ YAZ. Sadece ÖNEMLİ bilgileri çıkar."""
     if session_summary:
         session_data = await db.therapy_sessions.find_one({"id": session_id})
         
-        profile = await db.user_profiles.find_one({"user_id": user.id})
+        profile = await db.user_profiles.find_one({"user_id": user.id}, {"_id": 1})
         
         if not profile:
             # Create new profile
@@ -488,7 +730,9 @@ KISA VE ÖZ YAZ. Sadece ÖNEMLİ bilgileri çıkar."""
                     "summary": session_summary
                 }]
             )
+            new_profile.profile_context = render_profile_context(new_profile.model_dump())
             await db.user_profiles.insert_one(new_profile.model_dump())
+            profile_context_cache.pop(user.id, None)
         else:
             # Update existing profile
             await db.user_profiles.update_one(
@@ -506,16 +750,16 @@ KISA VE ÖZ YAZ. Sadece ÖNEMLİ bilgileri çıkar."""
                     }
                 }
             )
+            await refresh_profile_context(user.id)
+            profile_context_cache.pop(user.id, None)
     
     return {"success": True, "summary_generated": session_summary is not None}
 
 # ============= MESSAGE & CHAT ROUTES =============
 
 @api_router.get("/sessions/{session_id}/messages")
-async def get_session_messages(request: Request, session_id: str):
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def get_session_messages(request: Request, session_id: str, auth: AuthContext = Depends(require_user)):
+    user = auth.user
     
     messages = await db.messages.find(
         {"session_id": session_id, "user_id": user.id},
@@ -524,18 +768,192 @@ async def get_session_messages(request: Request, session_id: str):
     
     return messages
 
-@api_router.post("/sessions/{session_id}/chat")
-async def chat_with_berkai(request: Request, session_id: str):
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def timed(stage: str, timings: Dict[str, float], awaitable):
+    """Await and record wall time in ms under timings[stage]"""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+# Recent turns per active session, appended on every write so chat turns skip the history read.
+# This bounded store is the only conversation state kept between LLM calls: every
+# LLM call gets the history in its prompt; no provider-side chat object outlives the call.
+# Windows are per worker: the memory store needs sticky routing per session, while
+# CONVERSATION_STORE=mongo keeps a versioned copy in conversation_states that every worker checks.
+conversation_window_options = dict(
+    window_size=20,
+    max_sessions=int(os.environ.get('CONVERSATION_WINDOW_SESSIONS', '5000')),
+    idle_ttl=float(os.environ.get('CONVERSATION_WINDOW_IDLE_TTL', '1800')),
+    max_bytes=int(os.environ.get('CONVERSATION_WINDOW_MAX_BYTES', str(256 * 1024 * 1024)))
+)
+if os.environ.get('CONVERSATION_STORE', 'memory') == 'mongo':
+    conversation_windows = PersistentConversationWindows(db.conversation_states, **conversation_window_options)
+else:
+    conversation_windows = ConversationWindows(**conversation_window_options)
+
+async def load_session_history(user_id: str, session_id: str) -> List[Dict[str, Any]]:
+    key = (user_id, session_id)
+    window = conversation_windows.get(key)
+    if window is not None and await conversation_windows.is_current(key):
+        return window
+    
+    persisted = await conversation_windows.load(key)
+    if persisted is not None:
+        messages, version = persisted
+        conversation_windows.seed(key, messages, version)
+        return messages
+    
+    # Get current session history (son 20 mesaj), newest first then back in order
+    recent_messages = await db.messages.find(
+        {"session_id": session_id, "user_id": user_id},
+        {"_id": 0, "id": 1, "role": 1, "content": 1}
+    ).sort("timestamp", -1).limit(20).to_list(20)
+    recent_messages.reverse()
+    
+    conversation_windows.seed(key, recent_messages)
+    await conversation_windows.save_all(key, recent_messages)
+    return recent_messages
+
+async def record_conversation_message(user_id: str, session_id: str, message_doc: Dict[str, Any]):
+    """Keep the session's conversation state in step with a message write"""
+    key = (user_id, session_id)
+    conversation_windows.append(key, message_doc)
+    await conversation_windows.save(key, message_doc)
+
+# Rendered profile context per user as (profile_context_version, text). Used only while the
+# stored version matches, so a summary added on any worker shows up on the next turn everywhere
+profile_context_cache: TTLCache = TTLCache(
+    maxsize=int(os.environ.get('PROFILE_CONTEXT_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('PROFILE_CONTEXT_CACHE_TTL', '600'))
+)
+
+# Only the parts of a profile that end up in the prompt
+PROFILE_CONTEXT_PROJECTION = {
+    "_id": 0,
+    "main_issues": 1,
+    "triggers": 1,
+    "coping_strategies": 1,
+    "session_summaries": {"$slice": -5}
+}
+
+def render_profile_context(user_profile: Dict[str, Any]) -> str:
+    # Build comprehensive profile context
+    parts = ["KULLANICI PROFİLİ VE GEÇMİŞ:\n"]
     
-    data = await request.json()
+    if user_profile.get("main_issues"):
+        parts.append(f"\nAna Sorunlar: {', '.join(user_profile['main_issues'])}")
+    
+    if user_profile.get("triggers"):
+        parts.append(f"\nTetikleyiciler: {', '.join(user_profile['triggers'])}")
+    
+    if user_profile.get("coping_strategies"):
+        parts.append(f"\nBaşa Çıkma Stratejileri: {', '.join(user_profile['coping_strategies'])}")
+    
+    # Include session summaries (last 5 sessions)
+    if user_profile.get("session_summaries"):
+        parts.append("\n\nÖnceki Seanslardan Önemli Notlar:")
+        for summary_data in user_profile["session_summaries"][-5:]:
+            parts.append(f"\n[{summary_data.get('date', 'Tarih yok')[:10]}]\n{summary_data.get('summary', '')}\n")
+    
+    return "".join(parts)
+
+async def refresh_profile_context(user_id: str) -> Optional[str]:
+    """Re-render the stored profile_context from the last 5 summaries"""
+    user_profile = await db.user_profiles.find_one({"user_id": user_id}, PROFILE_CONTEXT_PROJECTION)
+    if not user_profile:
+        return None
+    
+    profile_context = render_profile_context(user_profile)
+    await db.user_profiles.update_one(
+        {"user_id": user_id},
+        {"$set": {"profile_context": profile_context}, "$inc": {"profile_context_version": 1}}
+    )
+    return profile_context
+
+async def load_profile_context(user_id: str, session_id: str) -> str:
+    # A point read of the version; the (multi-KB) context is only fetched when it changed
+    profile_version = await db.user_profiles.find_one({"user_id": user_id}, {"_id": 0, "profile_context_version": 1})
+    version = profile_version.get("profile_context_version", 0) if profile_version is not None else None
+    cached = profile_context_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    # Load the precomputed RAG context rather than the whole profile document
+    user_profile = None
+    if profile_version is not None:
+        user_profile = await db.user_profiles.find_one({"user_id": user_id}, {"_id": 0, "profile_context": 1})
+    
+    profile_context = ""
+    if user_profile is not None:
+        profile_context = user_profile.get("profile_context")
+        if profile_context is None:
+            # Profile written before profile_context existed
+            profile_context = await refresh_profile_context(user_id) or ""
+    
+    # If no profile exists, create basic context from recent sessions
+    if not profile_context:
+        previous_sessions = await db.therapy_sessions.find(
+            {"user_id": user_id, "id": {"$ne": session_id}, "ai_summary": {"$exists": True}},
+            {"_id": 0, "started_at": 1, "ai_summary": 1}
+        ).sort("started_at", -1).limit(3).to_list(3)
+        
+        if previous_sessions:
+            profile_context = "Önceki Seanslardan Notlar:\n"
+            for prev_session in previous_sessions:
+                session_date = prev_session["started_at"].strftime("%d.%m.%Y")
+                profile_context += f"\n[{session_date}]\n{prev_session.get('ai_summary', '')}\n"
+    
+    profile_context_cache[user_id] = (version, profile_context)
+    return profile_context
+
+# Token budget for the chat system prompt; sections beyond it are elided by priority
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '6000'))
+
+CHAT_RULES = """ÖNEMLİ İLETİŞİM KURALLARI:
+1. **Tanışma Aşaması**: İlk mesajlarda kullanıcıyı tanımak için sorular sor. Samimi ve dostça ol.
+2. **Sohbet Aşaması**: Her yanıtını MAKSIMUM 3-4 cümle ile sınırla. Kısa ve öz ol. Her seferde sadece birkaç soru sor, kullanıcıyı boğma.
+3. **Öneri/Tavsiye Aşaması**: Bir öneri veya tavsiye veriyorsan, BURDA detaylı ve kapsamlı ol. Açıklayıcı ve yardımcı olabilirsin.
+
+YAPMA:
+- Uzun paragraflar yazma (öneri vermiyorsan)
+- Soru yağmuruna tutma
+- Aynı anda çok fazla şey sorma
+
+YAP:
+- Tek seferde az soru sor
+- Kısa ve net yanıtlar ver
+- Danışan rahat hissetsin
+- Önceki seansları hatırla ve süreklilik sağla
+- Samimi ama profesyonel ol"""
+
+async def begin_chat_turn(
+    user: User,
+    session_id: str,
+    data: Dict[str, Any],
+    on_risk: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Everything a chat turn does before the LLM call: persist the user message,
+    assess risk and build the system prompt. Shared by the REST and streaming routes.
+    Returns crisis_response set (and no prompt) when the turn must not reach the LLM.
+    `on_risk` gets the risk result as soon as it is computed, before any I/O.
+    
+    Stages without data dependencies run concurrently: the message insert, the
+    history and profile reads and the (slow) video analysis all overlap. The
+    risk assessment is saved only after the user message; it and the video
+    telemetry are written behind unless the risk is high or critical.
+    """
     user_message_text = data.get("message", "")
     video_frame = data.get("video_frame")  # base64
     analyze_video = data.get("analyze_video", False)  # Optional video analysis
+    timings: Dict[str, float] = {}
+    turn_started = time.perf_counter()
+    settings = ai_settings.current
+    
+    if len(user_message_text) > int(settings["max_message_length"]):
+        raise HTTPException(status_code=413, detail="Message too long")
     
-    # Save user message
     user_msg = Message(
         session_id=session_id,
         user_id=user.id,
@@ -543,38 +961,46 @@ async def chat_with_berkai(request: Request, session_id: str):
         content=user_message_text
     )
     msg_doc = user_msg.model_dump()
-    await db.messages.insert_one(msg_doc)
-    message_id = msg_doc.get("id", user_msg.id)
     
     # ⚠️ RISK ASSESSMENT - Critical Feature
     risk_result = analyze_message_risk(user_message_text)
+    if on_risk is not None:
+        on_risk(risk_result)
+    notify_doctor = should_notify_doctor(risk_result) and bool(user.assigned_doctor_id)
     
-    # Save risk assessment to database
+    # Risk assessment row, written once the message it points at is saved
     risk_assessment = {
         "id": str(uuid.uuid4()),
         "user_id": user.id,
         "session_id": session_id,
-        "message_id": message_id,
+        "message_id": user_msg.id,
         "risk_level": risk_result["risk_level"],
         "risk_category": risk_result["risk_category"],
         "risk_indicators": risk_result["risk_indicators"],
         "suicide_risk": risk_result["suicide_risk"],
         "self_harm_risk": risk_result["self_harm_risk"],
         "crisis_detected": risk_result["crisis_detected"],
-        "doctor_notified": False,
+        "doctor_notified": notify_doctor,
         "timestamp": datetime.now(timezone.utc)
     }
-    await db.risk_assessments.insert_one(risk_assessment)
-    
-    # Notify doctor if high risk
-    if should_notify_doctor(risk_result) and user.assigned_doctor_id:
-        # Mark as notified
-        await db.risk_assessments.update_one(
-            {"id": risk_assessment["id"]},
-            {"$set": {"doctor_notified": True}}
-        )
-        # In production: Send email/SMS to doctor
-        logging.warning(f"🚨 HIGH RISK ALERT - User: {user.id}, Risk Level: {risk_result['risk_level']}")
+    
+    async def save_risk_assessment():
+        # Telemetry is written behind; rows behind a doctor alert are written durably before the reply
+        if risk_result["risk_category"] in ("high", "critical"):
+            await db.risk_assessments.insert_one(risk_assessment)
+        else:
+            telemetry_writes.insert("risk_assessments", risk_assessment)
+        record_risk_summary(user.id, session_id, risk_result, risk_assessment["timestamp"])
+        
+        # Notify doctor if high risk
+        if notify_doctor:
+            # In production: Send email/SMS to doctor
+            logging.warning(f"🚨 HIGH RISK ALERT - User: {user.id}, Risk Level: {risk_result['risk_level']}")
+    
+    async def save_user_message():
+        await timed("save_message", timings, db.messages.insert_one(msg_doc))
+        # A failed insert raises before this, leaving no assessment or summary for a message that does not exist
+        await save_risk_assessment()
     
     # If critical, return crisis response immediately
     if risk_result["risk_category"] == "critical":
@@ -587,124 +1013,575 @@ async def chat_with_berkai(request: Request, session_id: str):
             role="assistant",
             content=crisis_response
         )
-        await db.messages.insert_one(ai_msg.model_dump())
+        crisis_doc = ai_msg.model_dump()
+        # User message and crisis reply in one round trip, both durable
+        await timed("save_message", timings, db.messages.insert_many([msg_doc, crisis_doc]))
+        await save_risk_assessment()
+        await record_conversation_message(user.id, session_id, msg_doc)
+        await record_conversation_message(user.id, session_id, crisis_doc)
         
         return {
-            "message": crisis_response,
-            "risk_assessment": risk_result,
-            "crisis_mode": True
+            "user_message_id": user_msg.id,
+            "user_message": user_message_text,
+            "risk_result": risk_result,
+            "crisis_response": crisis_response
         }
     
-    # Get current session history (son 20 mesaj)
-    current_session_messages = await db.messages.find(
-        {"session_id": session_id, "user_id": user.id},
-        {"_id": 0}
-    ).sort("timestamp", 1).limit(20).to_list(20)
+    # Video analysis only if requested and frame provided
+    async def no_video_analysis():
+        return None
     
-    # Load user profile with all session summaries (RAG system)
-    user_profile = await db.user_profiles.find_one({"user_id": user.id})
+    video_task = (
+        analyze_video_frame(video_frame, user.id, session_id)
+        if analyze_video and video_frame and settings["enable_video_analysis"] else no_video_analysis()
+    )
     
-    profile_context = ""
-    if user_profile:
-        # Build comprehensive profile context
-        profile_context = "KULLANICI PROFİLİ VE GEÇMİŞ:\n"
-        
-        if user_profile.get("main_issues"):
-            profile_context += f"\nAna Sorunlar: {', '.join(user_profile['main_issues'])}"
-        
-        if user_profile.get("triggers"):
-            profile_context += f"\nTetikleyiciler: {', '.join(user_profile['triggers'])}"
-        
-        if user_profile.get("coping_strategies"):
-            profile_context += f"\nBaşa Çıkma Stratejileri: {', '.join(user_profile['coping_strategies'])}"
-        
-        # Include session summaries (last 5 sessions)
-        if user_profile.get("session_summaries"):
-            profile_context += "\n\nÖnceki Seanslardan Önemli Notlar:"
-            for summary_data in user_profile["session_summaries"][-5:]:
-                profile_context += f"\n[{summary_data.get('date', 'Tarih yok')[:10]}]\n{summary_data.get('summary', '')}\n"
+    _, current_session_messages, profile_context, video_analysis_result = await asyncio.gather(
+        save_user_message(),
+        timed("load_history", timings, load_session_history(user.id, session_id)),
+        timed("load_profile", timings, load_profile_context(user.id, session_id)),
+        timed("video_analysis", timings, video_task)
+    )
     
-    # If no profile exists, create basic context from recent sessions
-    if not profile_context:
-        previous_sessions = await db.therapy_sessions.find(
-            {"user_id": user.id, "id": {"$ne": session_id}, "ai_summary": {"$exists": True}},
-            {"_id": 0, "started_at": 1, "ai_summary": 1}
-        ).sort("started_at", -1).limit(3).to_list(3)
-        
-        if previous_sessions:
-            profile_context = "Önceki Seanslardan Notlar:\n"
-            for prev_session in previous_sessions:
-                session_date = prev_session["started_at"].strftime("%d.%m.%Y")
-                profile_context += f"\n[{session_date}]\n{prev_session.get('ai_summary', '')}\n"
+    # The history read may race the insert of this turn's message; the window must hold it either way
+    await record_conversation_message(user.id, session_id, msg_doc)
     
-    # Video analysis only if requested and frame provided
-    video_analysis_result = None
-    if analyze_video and video_frame:
-        video_analysis_result = await analyze_video_frame(video_frame, user.id, session_id)
+    system_prompt = build_chat_prompt(user, user_msg.id, current_session_messages, profile_context, video_analysis_result)
+    
+    timings["total"] = round((time.perf_counter() - turn_started) * 1000, 1)
+    logging.info(f"Chat turn context stages (ms): {timings}")
     
-    # Build current conversation context
+    return {
+        "user_message_id": user_msg.id,
+        "user_message": user_message_text,
+        "risk_result": risk_result,
+        "crisis_response": None,
+        "system_prompt": system_prompt,
+        "video_analysis": video_analysis_result
+    }
+
+def build_chat_prompt(
+    user: User,
+    user_message_id: str,
+    history: List[Dict[str, Any]],
+    profile_context: str,
+    video_analysis: Optional[Dict[str, Any]]
+) -> str:
+    """System prompt for a chat turn, fitted to PROMPT_TOKEN_BUDGET"""
+    # Current conversation, without the message being answered (sent as the user turn)
     context_messages = []
-    for msg in current_session_messages[-10:]:  # Son 10 mesaj
+    for msg in dedupe_history(history, exclude_id=user_message_id)[-10:]:  # Son 10 mesaj
         role = "Kullanıcı" if msg['role'] == 'user' else "MiraMind"
         context_messages.append(f"{role}: {msg['content']}")
     
-    current_conversation = "\n".join(context_messages)
+    # Enhanced system prompt with full user profile, fitted to the token budget
+    sections = [
+        PromptSection(
+            "intro",
+            f"Sen MiraMind'sın, empatik ve samimi bir psikolojik destek asistanısın.\n\nKullanıcı: {user.name}",
+            priority=0, required=True
+        ),
+        PromptSection("profile", profile_context, priority=3, keep="middle", empty_text="İlk seans - önceki geçmiş yok"),
+        PromptSection("conversation", context_messages, priority=2, header="Bu Seanstaki Konuşma:\n"),
+        PromptSection("rules", CHAT_RULES, priority=0, required=True)
+    ]
+    # A failed analysis is still returned to the client, but says nothing about the user
+    if video_analysis and "error" not in video_analysis:
+        sections.append(PromptSection(
+            "video",
+            f"Şu anki duygusal durum: {video_analysis.get('emotion', 'belirsiz')}, Stres: {video_analysis.get('stress_level', 5)}/10",
+            priority=1
+        ))
     
-    # Enhanced system prompt with full user profile
-    system_prompt = f"""Sen MiraMind'sın, empatik ve samimi bir psikolojik destek asistanısın.
-
-Kullanıcı: {user.name}
+    prompt = assemble_prompt(sections, PROMPT_TOKEN_BUDGET)
+    logging.info(f"Chat prompt sections: {prompt.report()}")
+    return prompt.text
+
+# Turn fields rebuilt from the database on replay rather than kept in chat_turn_preparations
+TURN_CONTEXT_FIELDS = ("user_message", "system_prompt")
+
+async def restore_turn_context(user: User, session_id: str, turn: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rebuild the message text and system prompt of a replayed turn from the saved
+    user message, the session history and the profile, as of that message
+    """
+    if turn["crisis_response"]:
+        return turn
+    history, profile_context = await asyncio.gather(
+        load_session_history(user.id, session_id),
+        load_profile_context(user.id, session_id)
+    )
+    # Later turns are not part of this one's context
+    position = next((i for i, msg in enumerate(history) if msg.get("id") == turn["user_message_id"]), None)
+    if position is not None:
+        user_message = history[position]["content"]
+        history = history[:position]
+    else:
+        saved = await db.messages.find_one(
+            {"id": turn["user_message_id"], "user_id": user.id},
+            {"_id": 0, "content": 1}
+        )
+        user_message = saved["content"] if saved else ""
+    return {
+        **turn,
+        "user_message": user_message,
+        "system_prompt": build_chat_prompt(user, turn["user_message_id"], history, profile_context, turn["video_analysis"])
+    }
 
-{profile_context if profile_context else "İlk seans - önceki geçmiş yok"}
+async def save_assistant_message(user: User, session_id: str, content: str, video_analysis: Optional[Dict[str, Any]]):
+    ai_msg = Message(
+        session_id=session_id,
+        user_id=user.id,
+        role="assistant",
+        content=content,
+        video_analysis=video_analysis
+    )
+    ai_doc = ai_msg.model_dump()
+    await db.messages.insert_one(ai_doc)
+    await record_conversation_message(user.id, session_id, ai_doc)
+
+# Risk assessments, video analyses and the risk summaries derived from them; chat messages are never buffered
+telemetry_writes = WriteBehindBuffer(
+    db,
+    max_batch=int(os.environ.get('TELEMETRY_BATCH_SIZE', '200')),
+    flush_interval=float(os.environ.get('TELEMETRY_FLUSH_INTERVAL', '0.5'))
+)
 
-Bu Seanstaki Konuşma:
-{current_conversation}
+# Assessments kept in risk_summary.recent; a session request's ai_risk_level is their max
+RISK_SUMMARY_WINDOW = int(os.environ.get('RISK_SUMMARY_WINDOW', '10'))
+# Weight of the newest risk_level in risk_summary.ewma
+RISK_EWMA_ALPHA = float(os.environ.get('RISK_EWMA_ALPHA', '0.3'))
+
+def record_risk_summary(user_id: str, session_id: str, risk_result: Dict[str, Any], at: datetime) -> None:
+    """
+    Fold one assessment into the rolling risk_summary kept on both the therapy
+    session and the patient: turns, max_level/max_rank, last_critical_at, the
+    last RISK_SUMMARY_WINDOW categories, ewma and high_recent (high/critical
+    turns in the new window). One pipeline update per document, so the
+    write-behind buffer may apply it in any order relative to other writes.
+    """
+    level = risk_result["risk_level"]
+    category = risk_result["risk_category"]
+    # Every expression in a $set stage reads the document as it was, so the new window is spelled out
+    recent = {"$slice": [
+        {"$concatArrays": [{"$ifNull": ["$risk_summary.recent", []]}, [{"category": category, "at": at}]]},
+        -RISK_SUMMARY_WINDOW
+    ]}
+    fields: Dict[str, Any] = {
+        "risk_summary.high_recent": {"$size": {"$filter": {
+            "input": recent,
+            "cond": {"$in": ["$$this.category", ["high", "critical"]]}
+        }}},
+        "risk_summary.recent": recent,
+        "risk_summary.turns": {"$add": [{"$ifNull": ["$risk_summary.turns", 0]}, 1]},
+        "risk_summary.max_level": {"$max": ["$risk_summary.max_level", level]},
+        "risk_summary.max_rank": {"$max": ["$risk_summary.max_rank", RISK_TIERS.index(category)]},
+        "risk_summary.ewma": {"$add": [
+            RISK_EWMA_ALPHA * level,
+            {"$multiply": [1 - RISK_EWMA_ALPHA, {"$ifNull": ["$risk_summary.ewma", level]}]}
+        ]}
+    }
+    if category == "critical":
+        fields["risk_summary.last_critical_at"] = {"$max": ["$risk_summary.last_critical_at", at]}
+    # The session id comes from the URL; only the caller's own session may be updated
+    targets = (("therapy_sessions", {"id": session_id, "user_id": user_id}), ("users", {"_id": user_id}))
+    for collection, doc_filter in targets:
+        telemetry_writes.update(collection, doc_filter, [{"$set": fields}])
+
+def risk_summary_view(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Dashboard shape of a stored risk_summary (all zero/low when there is none yet)"""
+    summary = summary or {}
+    recent = summary.get("recent") or []
+    return {
+        "latest": recent[-1]["category"] if recent else "low",
+        "max_category": RISK_TIERS[summary.get("max_rank", 0)],
+        "max_level": summary.get("max_level", 0),
+        "ewma": round(summary.get("ewma", 0.0), 2),
+        "high_recent": summary.get("high_recent", 0),
+        "window": len(recent),
+        "turns": summary.get("turns", 0),
+        "last_critical_at": summary.get("last_critical_at")
+    }
 
-ÖNEMLİ İLETİŞİM KURALLARI:
-1. **Tanışma Aşaması**: İlk mesajlarda kullanıcıyı tanımak için sorular sor. Samimi ve dostça ol.
-2. **Sohbet Aşaması**: Her yanıtını MAKSIMUM 3-4 cümle ile sınırla. Kısa ve öz ol. Her seferde sadece birkaç soru sor, kullanıcıyı boğma.
-3. **Öneri/Tavsiye Aşaması**: Bir öneri veya tavsiye veriyorsan, BURDA detaylı ve kapsamlı ol. Açıklayıcı ve yardımcı olabilirsin.
+# Chat responses by (user, Idempotency-Key); the TTL must match the idempotency_keys index
+chat_idempotency = IdempotencyStore(ttl=24 * 60 * 60, collection=db.idempotency_keys)
+# Prepared turns (user message saved, risk assessed) by the same key, so a retry after a
+# degraded reply answers the saved message instead of saving and scoring it again.
+# Only ids and results are kept; the message text and prompt are rebuilt on replay
+chat_turn_preparations = IdempotencyStore(ttl=24 * 60 * 60, collection=db.chat_turn_preparations)
 
-YAPMA:
-- Uzun paragraflar yazma (öneri vermiyorsan)
-- Soru yağmuruna tutma
-- Aynı anda çok fazla şey sorma
+@api_router.post("/sessions/{session_id}/chat")
+async def chat_with_berkai(request: Request, session_id: str, auth: AuthContext = Depends(require_user)):
+    user = auth.user
+    
+    data = await request.json()
+    
+    # Retries and double submits with the same key replay the first result
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if not idempotency_key:
+        # Without a key a retry is indistinguishable from a new turn
+        try:
+            return await complete_chat_turn(user, session_id, await begin_chat_turn(user, session_id, data))
+        except ChatDegraded as e:
+            return e.response
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+    
+    scope = (user.id, idempotency_key)
+    fingerprint = request_fingerprint({"session_id": session_id, "body": data})
+    
+    async def run_turn():
+        context: Dict[str, Any] = {}
+        
+        async def prepare():
+            turn = await begin_chat_turn(user, session_id, data)
+            # Patient history and profile stay out of the stored preparation
+            for field in TURN_CONTEXT_FIELDS:
+                context[field] = turn.pop(field, None)
+            return turn
+        
+        turn = await chat_turn_preparations.run(scope, fingerprint, prepare)
+        if context:
+            turn = {**turn, **context}
+        else:
+            # A replay, or a duplicate that awaited the first request
+            turn = await restore_turn_context(user, session_id, turn)
+        return await complete_chat_turn(user, session_id, turn)
+    
+    try:
+        return await chat_idempotency.run(scope, fingerprint, run_turn)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+    except ChatDegraded as e:
+        # Raised, not returned, so the store never replays it; a retry with the key gets a real answer
+        return e.response
+
+DEGRADED_REPLY = (
+    "Şu anda yanıt vermekte zorlanıyorum, birkaç dakika içinde tekrar yazabilir misin? "
+    "Kendini güvende hissetmiyorsan lütfen 112'yi ara."
+)
 
-YAP:
-- Tek seferde az soru sor
-- Kısa ve net yanıtlar ver
-- Danışan rahat hissetsin
-- Önceki seansları hatırla ve süreklilik sağla
-- Samimi ama profesyonel ol"""
+class ChatDegraded(Exception):
+    """No model answered the turn; `response` is sent as is but never saved or replayed"""
+    
+    def __init__(self, response: Dict[str, Any]):
+        super().__init__("chat degraded")
+        self.response = response
+
+def hedge_delay(breaker) -> float:
+    p95 = breaker.p95()
+    if p95 is None:
+        return LLM_HEDGE_DEFAULT_DELAY
+    return min(max(p95, LLM_HEDGE_MIN_DELAY), LLM_CALL_TIMEOUT)
+
+async def complete_chat_turn(user: User, session_id: str, turn: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the LLM for a prepared turn, persist the reply and build the /chat response.
+    Raises ChatDegraded, carrying the fallback response, when no model answered.
+    """
+    if turn["crisis_response"]:
+        return {
+            "message": turn["crisis_response"],
+            "risk_assessment": turn["risk_result"],
+            "crisis_mode": True
+        }
     
-    if video_analysis_result:
-        system_prompt += f"\n\nŞu anki duygusal durum: {video_analysis_result.get('emotion', 'belirsiz')}, Stres: {video_analysis_result.get('stress_level', 5)}/10"
+    # Chat with user history context, on the model chosen in admin settings
+    settings = ai_settings.current
+    provider = settings["chat_provider"]
     
-    # GPT-5 Chat with user history context
-    chat = LlmChat(
-        api_key=EMERGENT_LLM_KEY,
-        session_id=f"berkai_{user.id}",  # User bazlı session ID - tüm seanslar aynı context
-        system_message=system_prompt
-    ).with_model("openai", "gpt-5")
+    def chat_call(model: str):
+        async def call():
+            return await llm.chat(
+                provider, model, turn["system_prompt"], turn["user_message"],
+                session_id=f"berkai_{user.id}"  # User bazlı session ID - tüm seanslar aynı context
+            )
+        # The scheduler slot is taken outside the breaker's clock: queueing is not provider latency
+        return llm_breakers.get(provider, model), call, lambda: llm_scheduler.slot(provider, "chat")
     
-    ai_response = await chat.send_message(UserMessage(text=user_message_text))
+    primary = chat_call(settings["chat_model"])
+    fallback_model = settings.get("fallback_chat_model")
+    fallback = chat_call(fallback_model) if fallback_model and fallback_model != settings["chat_model"] else None
+    try:
+        ai_response = await hedged_call(
+            llm_breakers, primary, fallback,
+            timeout=LLM_CALL_TIMEOUT,
+            hedge_delay=hedge_delay(primary[0]),
+            ignore=(LLMOverloaded,)
+        )
+    except LLMOverloaded:
+        # Local backpressure, answered with 503 + Retry-After rather than a reply
+        raise
+    except Exception as e:
+        # Open circuit, timeout or a provider error alike: the user gets the fallback reply.
+        # Not saved: a retry should get a real answer, and the history should not carry this
+        logging.warning(f"Chat degraded: {e!r}")
+        raise ChatDegraded({
+            "message": DEGRADED_REPLY,
+            "video_analysis": turn["video_analysis"],
+            "risk_assessment": turn["risk_result"],
+            "degraded": True
+        }) from None
     
     # Save AI response
-    ai_msg = Message(
-        session_id=session_id,
-        user_id=user.id,
-        role="assistant",
-        content=ai_response,
-        video_analysis=video_analysis_result
-    )
-    await db.messages.insert_one(ai_msg.model_dump())
+    await save_assistant_message(user, session_id, ai_response, turn["video_analysis"])
     
     return {
         "message": ai_response,
-        "video_analysis": video_analysis_result,
-        "risk_assessment": risk_result
+        "video_analysis": turn["video_analysis"],
+        "risk_assessment": turn["risk_result"]
     }
 
+def sse_event(event: str, payload: Any) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+async def next_token(tokens) -> Optional[str]:
+    try:
+        return await tokens.__anext__()
+    except StopAsyncIteration:
+        return None
+
+async def stream_chat_completion(system_prompt: str, user_text: str):
+    """Yield response tokens as the model generates them; holds a chat slot until the stream ends"""
+    # Streaming goes through the OpenAI SDK; other chat providers stream on the default model
+    settings = ai_settings.current
+    model = settings["chat_model"] if settings["chat_provider"] == "openai" else DEFAULT_AI_SETTINGS["chat_model"]
+    breaker = llm_breakers.get("openai", model)
+    if not breaker.allow():
+        raise ProviderUnavailable(breaker.name, "circuit open")
+    
+    # A stream is judged by its time to first token, counted from slot admission; a stall
+    # between later chunks fails the stream and is recorded too, but cannot be hedged
+    started = time.monotonic()
+    recorded = False
+    try:
+        async with llm_scheduler.slot("openai", "chat"):
+            started = time.monotonic()
+            tokens = llm.stream_chat(model, system_prompt, user_text).__aiter__()
+            try:
+                token = await asyncio.wait_for(next_token(tokens), timeout=LLM_CALL_TIMEOUT)
+                breaker.record(True, time.monotonic() - started)
+                recorded = True
+                while token is not None:
+                    yield token
+                    started = time.monotonic()
+                    token = await asyncio.wait_for(next_token(tokens), timeout=LLM_STREAM_CHUNK_TIMEOUT)
+            finally:
+                # Client gone, stall or error: close the provider's stream (and its HTTP
+                # response) before the slot is handed on
+                await tokens.aclose()
+    except asyncio.TimeoutError:
+        breaker.record(False, time.monotonic() - started)
+        recorded = True
+        raise ProviderUnavailable(breaker.name, "timed out") from None
+    except LLMOverloaded:
+        raise
+    except Exception:
+        if not recorded:
+            breaker.record(False, time.monotonic() - started)
+            recorded = True
+        raise
+    finally:
+        if not recorded:
+            breaker.release()
+
+@api_router.post("/sessions/{session_id}/chat/stream")
+async def chat_with_berkai_stream(request: Request, session_id: str, auth: AuthContext = Depends(require_user)):
+    """
+    Streaming variant of /chat over Server-Sent Events
+    Events: risk_assessment (always first), video_analysis, token*, done | error
+    """
+    user = auth.user
+    
+    data = await request.json()
+    risk_ready: asyncio.Future = asyncio.get_running_loop().create_future()
+    turn_task = asyncio.create_task(begin_chat_turn(user, session_id, data, on_risk=risk_ready.set_result))
+    await asyncio.wait({turn_task, risk_ready}, return_when=asyncio.FIRST_COMPLETED)
+    if not risk_ready.done():
+        # Failed before the assessment (e.g. message too long): still a plain HTTP error
+        await turn_task
+    
+    async def event_stream():
+        # Sent while the message insert, history and profile reads and video analysis still run
+        yield sse_event("risk_assessment", risk_ready.result())
+        try:
+            turn = await turn_task
+        except Exception as e:
+            logging.error(f"Chat stream turn error: {e!r}")
+            yield sse_event("error", {"detail": "Yanıt oluşturulamadı"})
+            return
+        
+        if turn["crisis_response"]:
+            yield sse_event("done", {"message": turn["crisis_response"], "crisis_mode": True})
+            return
+        
+        if turn["video_analysis"]:
+            yield sse_event("video_analysis", turn["video_analysis"])
+        
+        chunks = []
+        tokens = stream_chat_completion(turn["system_prompt"], turn["user_message"])
+        try:
+            async for token in tokens:
+                chunks.append(token)
+                yield sse_event("token", {"text": token})
+        except LLMOverloaded as e:
+            logging.warning(f"Chat stream refused: {e}")
+            yield sse_event("error", {"detail": "Sistem şu anda yoğun, lütfen tekrar deneyin", "retry_after": LLM_RETRY_AFTER})
+            return
+        except Exception as e:
+            # Same fallback as /chat for an open circuit, a stall or a provider error
+            logging.warning(f"Chat stream degraded: {e!r}")
+            yield sse_event("error", {"detail": DEGRADED_REPLY, "degraded": True})
+            return
+        finally:
+            # On disconnect this generator is closed at a yield; close the model stream now, not at GC
+            await tokens.aclose()
+        
+        ai_response = "".join(chunks)
+        await save_assistant_message(user, session_id, ai_response, turn["video_analysis"])
+        yield sse_event("done", {"message": ai_response, "crisis_mode": False})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ============= LIVE SESSION CHANNEL =============
+
+# Whisper rejects uploads above 25 MB
+MAX_WS_AUDIO_BYTES = 25 * 1024 * 1024
+
+# Also the WebSocket origin allow-list: CORS does not cover handshakes, yet browsers send cookies on them
+CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
+
+@api_router.websocket("/sessions/{session_id}/ws")
+async def session_channel(websocket: WebSocket, session_id: str):
+    """
+    One connection per live session, multiplexing what SessionPage otherwise
+    sends as separate HTTP calls. JSON text frames, each with a "type":
+      client: chat {message, video_frame?, analyze_video?}, video_frame {frame},
+              audio_end (after binary audio chunks), analytics, ping
+      server: risk_assessment, risk_alert, message, video_analysis, transcript,
+              analytics, pong, error
+    Auth and persistence go through the same helpers as the REST routes.
+    """
+    # Any page could otherwise open a socket riding the user's session cookie
+    origin = websocket.headers.get("origin")
+    if origin and "*" not in CORS_ORIGINS and origin not in CORS_ORIGINS:
+        await websocket.close(code=1008)
+        return
+    auth = await resolve_auth(websocket)
+    if not auth:
+        await websocket.close(code=4401)
+        return
+    user = auth.user
+    await websocket.accept()
+    
+    send_lock = asyncio.Lock()
+    chat_lock = asyncio.Lock()  # chat turns stay ordered; frames and audio run alongside
+    audio_chunks: List[bytes] = []
+    audio_size = 0
+    pending: set = set()
+    
+    async def send(event_type: str, payload: Any = None):
+        frame = {"type": event_type}
+        if payload is not None:
+            frame["data"] = payload
+        async with send_lock:
+            await websocket.send_text(json.dumps(frame, ensure_ascii=False, default=str))
+    
+    async def handle_chat(frame: Dict[str, Any]):
+        async with chat_lock:
+            turn = await begin_chat_turn(user, session_id, frame)
+            await send("risk_assessment", turn["risk_result"])
+            if should_notify_doctor(turn["risk_result"]):
+                await send("risk_alert", {"risk_category": turn["risk_result"]["risk_category"]})
+            try:
+                await send("message", await complete_chat_turn(user, session_id, turn))
+            except ChatDegraded as e:
+                await send("message", e.response)
+    
+    async def handle_frame(frame: Dict[str, Any]):
+        if not ai_settings.get("enable_video_analysis"):
+            await send("error", {"detail": "Video analysis is disabled"})
+            return
+        await send("video_analysis", await analyze_video_frame(frame["frame"], user.id, session_id))
+    
+    async def handle_audio(content: bytes):
+        await send("transcript", {"text": await transcribe_bytes(content)})
+    
+    async def handle_analytics():
+        await send("analytics", await build_session_analytics(user.id, session_id))
+    
+    def spawn(coro):
+        async def guarded():
+            try:
+                await coro
+            except Exception as e:
+                logging.error(f"Session channel error: {e}")
+                # Only client-facing details are sent; internal error text stays in the log, as on the SSE route
+                if isinstance(e, HTTPException):
+                    payload = {"detail": e.detail}
+                elif isinstance(e, LLMOverloaded):
+                    payload = {"detail": "Sistem şu anda yoğun, lütfen tekrar deneyin", "retry_after": LLM_RETRY_AFTER}
+                else:
+                    payload = {"detail": "İstek işlenemedi"}
+                try:
+                    await send("error", payload)
+                except Exception:
+                    pass
+        task = asyncio.create_task(guarded())
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    
+    try:
+        while True:
+            incoming = await websocket.receive()
+            if incoming["type"] == "websocket.disconnect":
+                break
+            
+            if incoming.get("bytes") is not None:
+                audio_size += len(incoming["bytes"])
+                if audio_size > MAX_WS_AUDIO_BYTES:
+                    audio_chunks, audio_size = [], 0
+                    await send("error", {"detail": "Audio too large"})
+                    continue
+                audio_chunks.append(incoming["bytes"])
+                continue
+            
+            try:
+                frame = json.loads(incoming.get("text") or "")
+            except json.JSONDecodeError:
+                await send("error", {"detail": "Invalid JSON"})
+                continue
+            if not isinstance(frame, dict):
+                await send("error", {"detail": "Frame must be a JSON object"})
+                continue
+            
+            frame_type = frame.get("type")
+            if frame_type == "chat":
+                spawn(handle_chat(frame))
+            elif frame_type == "video_frame" and frame.get("frame"):
+                spawn(handle_frame(frame))
+            elif frame_type == "audio_end":
+                if not audio_chunks:
+                    await send("error", {"detail": "No audio received"})
+                    continue
+                content = b"".join(audio_chunks)
+                audio_chunks, audio_size = [], 0
+                spawn(handle_audio(content))
+            elif frame_type == "analytics":
+                spawn(handle_analytics())
+            elif frame_type == "ping":
+                await send("pong")
+            else:
+                await send("error", {"detail": f"Unsupported frame type: {frame_type}"})
+    except WebSocketDisconnect:
+        # In-flight turns run to completion so persistence matches the REST routes
+        pass
+
 # ============= VIDEO ANALYSIS =============
 
 async def analyze_video_frame(frame_base64: str, user_id: str, session_id: str) -> Dict[str, Any]:
@@ -718,18 +1595,6 @@ async def analyze_video_frame(frame_base64: str, user_id: str, session_id: str)
         with open(temp_path, 'wb') as f:
             f.write(frame_data)
         
-        # Gemini Vision Analysis
-        chat = LlmChat(
-            api_key=GEMINI_API_KEY,
-            session_id=f"vision_{session_id}",
-            system_message="Sen bir video analiz uzmanısın. Görüntülerdeki kişinin duygusal durumunu, stres seviyesini, göz hareketlerini ve vücut dilini analiz ediyorsun."
-        ).with_model("gemini", "gemini-2.5-pro")
-        
-        video_file = FileContentWithMimeType(
-            file_path=temp_path,
-            mime_type="image/jpeg"
-        )
-        
         analysis_prompt = """Bu görüntüyü detaylıca analiz et ve şu bilgileri ver:
 
 1. Yüz ifadesi ve duygu durumu
@@ -750,13 +1615,27 @@ JSON formatında yanıt ver:
   "summary": "kısa özet"
 }"""
         
-        result = await chat.send_message(UserMessage(
-            text=analysis_prompt,
-            file_contents=[video_file]
-        ))
+        # Gemini Vision Analysis, behind its own breaker: a hanging or failing vision model
+        # costs a chat turn at most LLM_CALL_TIMEOUT, then nothing while the circuit is open
+        vision_model = ai_settings.get("vision_model")
+        try:
+            result = await guarded_call(
+                llm_breakers.get("gemini", vision_model),
+                lambda: llm.vision(
+                    vision_model,
+                    "Sen bir video analiz uzmanısın. Görüntülerdeki kişinin duygusal durumunu, stres seviyesini, göz hareketlerini ve vücut dilini analiz ediyorsun.",
+                    analysis_prompt,
+                    temp_path,
+                    session_id=f"vision_{session_id}"
+                ),
+                timeout=LLM_CALL_TIMEOUT,
+                ignore=(LLMOverloaded,),
+                admit=lambda: llm_scheduler.slot("gemini", "vision")
+            )
+        finally:
+            os.remove(temp_path)
         
         # Parse result
-        import json
         try:
             analysis_data = json.loads(result)
         except:
@@ -775,10 +1654,7 @@ JSON formatında yanıt ver:
             stress_level=analysis_data.get("stress_level"),
             emotion_detected=analysis_data.get("emotion")
         )
-        await db.video_analyses.insert_one(analysis.model_dump())
-        
-        # Cleanup
-        os.remove(temp_path)
+        telemetry_writes.insert("video_analyses", analysis.model_dump())
         
         return analysis_data
         
@@ -790,13 +1666,13 @@ JSON formatında yanıt ver:
         }
 
 @api_router.get("/sessions/{session_id}/analytics")
-async def get_session_analytics(request: Request, session_id: str):
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
+async def get_session_analytics(request: Request, session_id: str, auth: AuthContext = Depends(require_user)):
+    user = auth.user
+    return await build_session_analytics(user.id, session_id)
+
+async def build_session_analytics(user_id: str, session_id: str) -> Dict[str, Any]:
     analyses = await db.video_analyses.find(
-        {"session_id": session_id, "user_id": user.id},
+        {"session_id": session_id, "user_id": user_id},
         {"_id": 0, "frame_data": 0}
     ).sort("timestamp", 1).to_list(100)
     
@@ -838,30 +1714,30 @@ async def serve_audio(filename: str):
 
 # ============= SPEECH TO TEXT =============
 
-@api_router.post("/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
-    """Transcribe audio to text using Whisper"""
+async def transcribe_bytes(content: bytes) -> str:
+    # Save uploaded file temporarily
+    temp_path = f"/tmp/audio_{uuid.uuid4()}.webm"
+    
+    with open(temp_path, "wb") as f:
+        f.write(content)
+    
     try:
-        # Save uploaded file temporarily
-        temp_path = f"/tmp/audio_{uuid.uuid4()}.webm"
-        
-        with open(temp_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
         # Transcribe using Whisper
-        with open(temp_path, "rb") as audio_file:
-            transcript = await openai_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="tr"  # Turkish
-            )
-        
+        async with llm_scheduler.slot("whisper", "chat"):
+            return await llm.transcribe(temp_path, language="tr")  # Turkish
+    finally:
         # Cleanup
         os.remove(temp_path)
+
+@api_router.post("/transcribe")
+async def transcribe_audio(file: UploadFile = File(...)):
+    """Transcribe audio to text using Whisper"""
+    try:
+        content = await file.read()
+        return {"text": await transcribe_bytes(content)}
         
-        return {"text": transcript.text}
-        
+    except LLMOverloaded:
+        raise
     except Exception as e:
         logging.error(f"Transcription error: {e}")
         raise HTTPException(status_code=500, detail="Transcription failed")
@@ -869,31 +1745,44 @@ async def transcribe_audio(file: UploadFile = File(...)):
 # ============= DOCTOR ROUTES =============
 
 @api_router.get("/doctor/patients")
-async def get_doctor_patients(request: Request):
+async def get_doctor_patients(request: Request, auth: AuthContext = Depends(require_doctor)):
     """Get all patients assigned to doctor"""
-    user = await get_current_user(request)
-    if not user or user.user_type not in ["doctor", "psychiatrist"]:
-        raise HTTPException(status_code=403, detail="Only doctors can access")
+    user = auth.user
     
     # Get assigned patients
     patients = await db.users.find(
         {"_id": {"$in": user.assigned_patients}}
     ).to_list(100)
     
-    # Get session counts and risk levels for each patient
+    # Session counts for all patients in one grouped query
+    patient_ids = [patient["_id"] for patient in patients]
+    session_counts = {
+        row["_id"]: row["count"]
+        async for row in db.therapy_sessions.aggregate([
+            {"$match": {"user_id": {"$in": patient_ids}}},
+            {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+        ])
+    }
+    
     for patient in patients:
         patient_id = patient["_id"]
         patient["id"] = patient_id  # Add id field for consistency
+        patient["session_count"] = session_counts.get(patient_id, 0)
         
-        session_count = await db.therapy_sessions.count_documents({"user_id": patient_id})
-        patient["session_count"] = session_count
-        
-        # Get latest risk assessment
-        latest_risk = await db.risk_assessments.find_one(
-            {"user_id": patient_id},
-            sort=[("timestamp", -1)]
-        )
-        patient["latest_risk"] = latest_risk["risk_category"] if latest_risk else "low"
+        # Risk trend precomputed on the patient document by record_risk_summary
+        summary = patient.pop("risk_summary", None)
+        risk = risk_summary_view(summary)
+        if summary is None:
+            # No assessment since the summary was introduced: fall back to the stored rows
+            latest_risk = await db.risk_assessments.find_one(
+                {"user_id": patient_id},
+                {"_id": 0, "risk_category": 1},
+                sort=[("timestamp", -1)]
+            )
+            if latest_risk:
+                risk["latest"] = latest_risk["risk_category"]
+        patient["latest_risk"] = risk["latest"]
+        patient["risk_trend"] = risk
         
         # Remove _id to avoid serialization issues
         patient.pop("_id", None)
@@ -901,11 +1790,9 @@ async def get_doctor_patients(request: Request):
     return patients
 
 @api_router.post("/doctor/add-patient")
-async def add_patient_to_doctor(request: Request):
+async def add_patient_to_doctor(request: Request, auth: AuthContext = Depends(require_doctor)):
     """Add patient to doctor using patient ID"""
-    user = await get_current_user(request)
-    if not user or user.user_type not in ["doctor", "psychiatrist"]:
-        raise HTTPException(status_code=403, detail="Only doctors can access")
+    user = auth.user
     
     data = await request.json()
     patient_id_number = data.get("patient_id_number")
@@ -919,7 +1806,7 @@ async def add_patient_to_doctor(request: Request):
         raise HTTPException(status_code=400, detail="User is not a patient")
     
     # Add patient to doctor's list
-    if patient["_id"] not in user.assigned_patients:
+    if str(patient["_id"]) not in auth.assigned_patient_ids:
         await db.users.update_one(
             {"_id": user.id},
             {"$push": {"assigned_patients": patient["_id"]}}
@@ -930,19 +1817,17 @@ async def add_patient_to_doctor(request: Request):
         {"_id": patient["_id"]},
         {"$set": {"assigned_doctor_id": user.id}}
     )
+    await invalidate_user_cache(user.id, patient["_id"])
     
     return {"success": True, "patient": patient}
 
 @api_router.get("/doctor/patient/{patient_id}/risk-alerts")
-async def get_patient_risk_alerts(request: Request, patient_id: str):
+async def get_patient_risk_alerts(request: Request, patient_id: str, auth: AuthContext = Depends(require_doctor)):
     """Get risk assessments for a patient"""
-    user = await get_current_user(request)
-    if not user or user.user_type not in ["doctor", "psychiatrist"]:
-        raise HTTPException(status_code=403, detail="Only doctors can access")
+    user = auth.user
     
     # Verify patient is assigned to doctor
-    assigned_patient_ids = [str(pid) for pid in user.assigned_patients]
-    if patient_id not in assigned_patient_ids:
+    if patient_id not in auth.assigned_patient_ids:
         raise HTTPException(status_code=403, detail="Patient not assigned to you")
     
     # Get risk assessments
@@ -954,15 +1839,11 @@ async def get_patient_risk_alerts(request: Request, patient_id: str):
     return risks
 
 @api_router.post("/doctor/patient/{patient_id}/note")
-async def add_doctor_note(request: Request, patient_id: str):
+async def add_doctor_note(request: Request, patient_id: str, auth: AuthContext = Depends(require_doctor)):
     """Add clinical note for patient"""
-    user = await get_current_user(request)
-    if not user or user.user_type not in ["doctor", "psychiatrist"]:
-        raise HTTPException(status_code=403, detail="Only doctors can access")
+    user = auth.user
     
-    # Convert assigned_patients to strings for comparison
-    assigned_patient_ids = [str(pid) for pid in user.assigned_patients]
-    if patient_id not in assigned_patient_ids:
+    if patient_id not in auth.assigned_patient_ids:
         raise HTTPException(status_code=403, detail="Patient not assigned to you")
     
     data = await request.json()
@@ -994,14 +1875,11 @@ async def add_doctor_note(request: Request, patient_id: str):
     return {"success": True, "note": note_response}
 
 @api_router.get("/doctor/patient/{patient_id}/notes")
-async def get_patient_notes(request: Request, patient_id: str):
+async def get_patient_notes(request: Request, patient_id: str, auth: AuthContext = Depends(require_doctor)):
     """Get all notes for a patient"""
-    user = await get_current_user(request)
-    if not user or user.user_type not in ["doctor", "psychiatrist"]:
-        raise HTTPException(status_code=403, detail="Only doctors can access")
+    user = auth.user
     
-    assigned_patient_ids = [str(pid) for pid in user.assigned_patients]
-    if patient_id not in assigned_patient_ids:
+    if patient_id not in auth.assigned_patient_ids:
         raise HTTPException(status_code=403, detail="Patient not assigned to you")
     
     notes = await db.doctor_notes.find(
@@ -1032,6 +1910,7 @@ async def admin_login(request: Request, response: Response):
         "created_at": datetime.now(timezone.utc)
     }
     await db.admin_sessions.insert_one(admin_session_doc)
+    admin_session_cache.set(admin_token, {"email": email}, admin_session_doc["expires_at"])
     
     # Set cookie
     response.set_cookie(
@@ -1051,7 +1930,12 @@ async def admin_logout(request: Request, response: Response):
     """Admin logout"""
     admin_token = request.cookies.get("admin_token")
     if admin_token:
-        await db.admin_sessions.delete_many({"session_token": admin_token})
+        # Keep the row until expiry so other workers pick up the revocation
+        await db.admin_sessions.update_many(
+            {"session_token": admin_token},
+            {"$set": {"revoked_at": datetime.now(timezone.utc)}}
+        )
+        admin_session_cache.invalidate(admin_token)
     response.delete_cookie("admin_token", path="/")
     return {"success": True}
 
@@ -1105,9 +1989,35 @@ async def get_admin_stats(request: Request):
         "recent_activity": {
             "sessions": [{"id": s.get("id"), "user_id": s.get("user_id"), "started_at": s.get("started_at"), "status": s.get("status")} for s in recent_sessions],
             "users": [{"email": u.get("email"), "name": u.get("name"), "created_at": u.get("created_at")} for u in recent_users]
+        },
+        "maintenance": {
+            "session_sweeper": session_sweep_stats
         }
     }
 
+@api_router.get("/admin/metrics")
+async def get_admin_metrics(request: Request):
+    """Get in-process performance metrics"""
+    is_admin = await verify_admin(request)
+    if not is_admin:
+        raise HTTPException(status_code=401, detail="Not authorized")
+    
+    return {
+        "llm_backend": LLM_BACKEND,
+        "auth_service": emergent_auth.stats(),
+        "caches": {
+            "user_sessions": user_session_cache.stats(),
+            "admin_sessions": admin_session_cache.stats(),
+            "profile_contexts": {"size": len(profile_context_cache), "maxsize": profile_context_cache.maxsize},
+            "conversation_windows": conversation_windows.stats(),
+            "chat_idempotency": chat_idempotency.stats()
+        },
+        "telemetry_writes": telemetry_writes.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "ai_settings": ai_settings.stats(),
+        "llm_breakers": llm_breakers.stats()
+    }
+
 @api_router.get("/admin/users")
 async def get_all_users(request: Request):
     """Get all users with complete information"""
@@ -1199,15 +2109,8 @@ async def get_ai_settings(request: Request):
         # Default settings
         default_settings = {
             "id": str(uuid.uuid4()),
-            "chat_model": "gpt-5",
-            "chat_provider": "openai",
-            "vision_model": "gemini-2.5-pro",
-            "tts_voice": "nova",
-            "tts_model": "tts-1",
-            "system_prompt": "Sen MiraMind'sın, empatik ve profesyonel bir psikolojik destek asistanısın.",
-            "max_message_length": 2000,
-            "enable_video_analysis": True,
-            "enable_tts": True,
+            **DEFAULT_AI_SETTINGS,
+            "version": 1,
             "updated_at": datetime.now(timezone.utc)
         }
         await db.ai_settings.insert_one(default_settings)
@@ -1223,13 +2126,17 @@ async def update_ai_settings(request: Request):
         raise HTTPException(status_code=401, detail="Not authorized")
     
     data = await request.json()
+    data.pop("_id", None)
+    data.pop("version", None)
     data["updated_at"] = datetime.now(timezone.utc)
     
+    # The version bump is what other workers' settings caches poll for
     await db.ai_settings.update_one(
         {},
-        {"$set": data},
+        {"$set": data, "$inc": {"version": 1}},
         upsert=True
     )
+    await ai_settings.refresh()
     
     return {"success": True}
 
@@ -1330,13 +2237,11 @@ async def get_pending_users(request: Request):
 @api_router.post("/admin/approve-user/{user_id}")
 async def approve_user(request: Request, user_id: str):
     """Approve a pending doctor/psychiatrist"""
-    admin = await verify_admin(request)
+    admin = await get_current_admin(request)
     if not admin:
         raise HTTPException(status_code=401, detail="Not authorized")
     
-    # Get admin info
-    admin_info = await db.admins.find_one({"email": request.cookies.get("admin_session_token")})
-    admin_id = admin_info.get("email") if admin_info else "admin"
+    admin_id = admin["email"]
     
     # Update user status
     result = await db.users.update_one(
@@ -1353,22 +2258,21 @@ async def approve_user(request: Request, user_id: str):
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or already processed")
+    await invalidate_user_cache(user_id)
     
     return {"success": True, "message": "Kullanıcı onaylandı"}
 
 @api_router.post("/admin/reject-user/{user_id}")
 async def reject_user(request: Request, user_id: str):
     """Reject a pending doctor/psychiatrist"""
-    admin = await verify_admin(request)
+    admin = await get_current_admin(request)
     if not admin:
         raise HTTPException(status_code=401, detail="Not authorized")
     
     data = await request.json()
     rejection_reason = data.get("reason", "Yeterli bilgi sağlanmadı")
     
-    # Get admin info
-    admin_info = await db.admins.find_one({"email": request.cookies.get("admin_session_token")})
-    admin_id = admin_info.get("email") if admin_info else "admin"
+    admin_id = admin["email"]
     
     # Update user status
     result = await db.users.update_one(
@@ -1385,17 +2289,16 @@ async def reject_user(request: Request, user_id: str):
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or already processed")
+    await invalidate_user_cache(user_id)
     
     return {"success": True, "message": "Kullanıcı reddedildi"}
 
 # ============= SESSION REQUEST ENDPOINTS =============
 
 @api_router.post("/session-requests")
-async def create_session_request(request: Request):
+async def create_session_request(request: Request, auth: AuthContext = Depends(require_user)):
     """Patient requests a session with a psychologist"""
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    user = auth.user
     
     data = await request.json()
     doctor_id = data.get("doctor_id")
@@ -1405,48 +2308,32 @@ async def create_session_request(request: Request):
     if not doctor_id:
         raise HTTPException(status_code=400, detail="doctor_id required")
     
-    # Get AI summary and risk level from latest session
-    latest_session = await db.therapy_sessions.find_one(
-        {"user_id": user.id},
-        sort=[("started_at", -1)]
+    # AI summary from the latest session, risk level from the patient's rolling risk summary
+    latest_session, patient = await asyncio.gather(
+        db.therapy_sessions.find_one(
+            {"user_id": user.id},
+            {"_id": 0, "ai_summary": 1},
+            sort=[("started_at", -1)]
+        ),
+        db.users.find_one({"_id": user.id}, {"risk_summary": 1})
     )
     
     ai_summary = None
-    ai_risk_level = "low"
     
     if latest_session and latest_session.get("ai_summary"):
         ai_summary = latest_session["ai_summary"]
     
-    # Get risk assessment from latest messages
-    recent_messages = await db.messages.find(
-        {"user_id": user.id},
-        {"_id": 0, "content": 1}
-    ).sort("timestamp", -1).limit(10).to_list(10)
-    
-    # Simple risk detection (can be enhanced with AI)
-    risk_keywords = {
-        "critical": ["intihar", "kendime zarar", "ölmek istiyorum"],
-        "high": ["çok kötü", "dayanamıyorum", "bıktım"],
-        "medium": ["üzgün", "stresli", "kaygılı"]
-    }
-    
-    for msg in recent_messages:
-        content_lower = msg.get("content", "").lower()
-        for keyword in risk_keywords["critical"]:
-            if keyword in content_lower:
-                ai_risk_level = "critical"
-                break
-        if ai_risk_level == "critical":
-            break
-        for keyword in risk_keywords["high"]:
-            if keyword in content_lower:
-                ai_risk_level = "high"
-                break
-        if ai_risk_level == "high":
-            break
-        for keyword in risk_keywords["medium"]:
-            if keyword in content_lower:
-                ai_risk_level = "medium"
+    risk_summary = (patient or {}).get("risk_summary")
+    if risk_summary is not None:
+        recent_categories = [entry.get("category") for entry in risk_summary.get("recent", [])]
+    else:
+        # Patients with no assessment since the summary was introduced: use their stored rows
+        recent_assessments = await db.risk_assessments.find(
+            {"user_id": user.id},
+            {"_id": 0, "risk_category": 1}
+        ).sort("timestamp", -1).limit(RISK_SUMMARY_WINDOW).to_list(RISK_SUMMARY_WINDOW)
+        recent_categories = [row.get("risk_category") for row in recent_assessments]
+    ai_risk_level = max_risk_category(recent_categories)
     
     session_request = {
         "id": str(uuid.uuid4()),
@@ -1468,11 +2355,9 @@ async def create_session_request(request: Request):
     return {"success": True, "request_id": session_request["id"], "risk_level": ai_risk_level}
 
 @api_router.get("/session-requests/my-requests")
-async def get_my_session_requests(request: Request):
+async def get_my_session_requests(request: Request, auth: AuthContext = Depends(require_user)):
     """Get patient's session requests"""
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    user = auth.user
     
     requests = await db.session_requests.find(
         {"patient_id": user.id}
@@ -1489,11 +2374,9 @@ async def get_my_session_requests(request: Request):
     return requests
 
 @api_router.get("/doctor/session-requests")
-async def get_doctor_session_requests(request: Request):
+async def get_doctor_session_requests(request: Request, auth: AuthContext = Depends(require_doctor)):
     """Get session requests for a doctor"""
-    user = await get_current_user(request)
-    if not user or user.user_type not in ["doctor", "psychiatrist"]:
-        raise HTTPException(status_code=403, detail="Access denied")
+    user = auth.user
     
     requests = await db.session_requests.find(
         {"doctor_id": user.id}
@@ -1510,11 +2393,9 @@ async def get_doctor_session_requests(request: Request):
     return requests
 
 @api_router.post("/doctor/session-requests/{request_id}/accept")
-async def accept_session_request(request: Request, request_id: str):
+async def accept_session_request(request: Request, request_id: str, auth: AuthContext = Depends(require_doctor)):
     """Doctor accepts a session request"""
-    user = await get_current_user(request)
-    if not user or user.user_type not in ["doctor", "psychiatrist"]:
-        raise HTTPException(status_code=403, detail="Access denied")
+    user = auth.user
     
     data = await request.json()
     scheduled_at = data.get("scheduled_at")
@@ -1540,11 +2421,9 @@ async def accept_session_request(request: Request, request_id: str):
     return {"success": True, "message": "Seans talebi kabul edildi"}
 
 @api_router.post("/doctor/session-requests/{request_id}/reject")
-async def reject_session_request(request: Request, request_id: str):
+async def reject_session_request(request: Request, request_id: str, auth: AuthContext = Depends(require_doctor)):
     """Doctor rejects a session request"""
-    user = await get_current_user(request)
-    if not user or user.user_type not in ["doctor", "psychiatrist"]:
-        raise HTTPException(status_code=403, detail="Access denied")
+    user = auth.user
     
     data = await request.json()
     response_message = data.get("response_message", "")
@@ -1563,11 +2442,9 @@ async def reject_session_request(request: Request, request_id: str):
     return {"success": True, "message": "Seans talebi reddedildi"}
 
 @api_router.get("/doctors/available")
-async def get_available_doctors(request: Request):
+async def get_available_doctors(request: Request, auth: AuthContext = Depends(require_user)):
     """Get list of approved doctors for patient to choose"""
-    user = await get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    user = auth.user
     
     doctors = await db.users.find(
         {
@@ -1592,7 +2469,7 @@ app.include_router(api_router)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+    allow_origins=CORS_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
@@ -1603,6 +2480,66 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# strict: refuse to start on a COLLSCAN, warn: log only, off: skip the explain() pass
+INDEX_SELF_CHECK = os.environ.get('INDEX_SELF_CHECK', 'strict')
+
+@app.on_event("startup")
+async def bootstrap_indexes():
+    await ensure_indexes(db)
+    if INDEX_SELF_CHECK == "off":
+        return
+    try:
+        await verify_query_plans(db)
+    except RuntimeError as e:
+        logger.error(str(e))
+        if INDEX_SELF_CHECK == "strict":
+            raise
+
+SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', '3600'))
+SESSION_SWEEP_COMPACT = os.environ.get('SESSION_SWEEP_COMPACT', 'false').lower() == 'true'
+
+# Last sweeper run, reported through /admin/stats
+session_sweep_stats: Dict[str, Any] = {"runs": 0, "last_run": None, "last_removed": {}, "total_removed": 0}
+
+async def session_sweep_loop():
+    while True:
+        try:
+            removed = await sweep_expired_sessions(db, compact=SESSION_SWEEP_COMPACT)
+            session_sweep_stats["runs"] += 1
+            session_sweep_stats["last_run"] = datetime.now(timezone.utc)
+            session_sweep_stats["last_removed"] = removed
+            session_sweep_stats["total_removed"] += sum(removed.values())
+            logger.info(f"Session sweep removed {removed}")
+        except Exception as e:
+            logger.error(f"Session sweep failed: {e}")
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    background_tasks.append(asyncio.create_task(session_sweep_loop()))
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    background_tasks.append(asyncio.create_task(revocation_sync_loop()))
+
+@app.on_event("startup")
+async def warm_prompt_tokenizer():
+    # Otherwise the first chat turn loads (or downloads) the BPE file on the event loop
+    await asyncio.to_thread(load_encoder)
+
+@app.on_event("startup")
+async def start_telemetry_writer():
+    telemetry_writes.start()
+
+@app.on_event("startup")
+async def start_settings_refresh():
+    background_tasks.append(asyncio.create_task(ai_settings.run()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for task in background_tasks:
+        task.cancel()
+    # Flush buffered telemetry while the client is still open
+    await telemetry_writes.close()
+    await emergent_auth.aclose()
+    client.close()
@@ -0,0 +1,83 @@
+"""
+Session Token Module for MiraMind Professional
+HMAC-signed session tokens that can be verified without a database lookup
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+TOKEN_PREFIX = "berkai_st"
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(secret: str, payload: str) -> str:
+    digest = hmac.new(secret.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def is_signed_token(token: str) -> bool:
+    return token.startswith(f"{TOKEN_PREFIX}.")
+
+
+def issue_session_token(secret: str, session_id: str, user_id: str, user_type: str, expires_at: datetime) -> str:
+    """
+    Build a signed token carrying the session id, user id, role and expiry
+    Format: berkai_st.<payload>.<signature>
+    """
+    claims = {
+        "sid": session_id,
+        "uid": user_id,
+        "role": user_type,
+        "exp": int(expires_at.timestamp())
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{TOKEN_PREFIX}.{payload}.{_signature(secret, payload)}"
+
+
+def verify_session_token(secret: str, token: str) -> Optional[Dict]:
+    """
+    Verify signature and expiry of a signed token
+    Returns the claims dict, or None if the token is malformed, forged or expired
+    """
+    # Header and cookie values arrive as latin-1 text; anything non-ASCII is not ours
+    if not token.isascii():
+        return None
+
+    try:
+        prefix, payload, signature = token.split(".")
+    except ValueError:
+        return None
+
+    if prefix != TOKEN_PREFIX:
+        return None
+
+    if not hmac.compare_digest(signature, _signature(secret, payload)):
+        return None
+
+    try:
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, json.JSONDecodeError):
+        return None
+
+    if not isinstance(claims, dict) or not all(key in claims for key in ("sid", "uid", "role", "exp")):
+        return None
+
+    if not isinstance(claims["exp"], (int, float)):
+        return None
+
+    if claims["exp"] <= datetime.now(timezone.utc).timestamp():
+        return None
+
+    claims["expires_at"] = datetime.fromtimestamp(claims["exp"], tz=timezone.utc)
+    return claims
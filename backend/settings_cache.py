@@ -0,0 +1,66 @@
+"""
+Settings Cache Module for MiraMind Professional
+In-process copy of the admin AI settings, kept fresh by cheap version polling
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+
+class SettingsCache:
+    """
+    Holds the single ai_settings document in memory so hot paths read it
+    with no I/O.
+
+    Every `poll_interval` seconds only (version, updated_at) is fetched; the
+    full document is reloaded when that marker changes. Writers bump
+    `version`, and the worker that wrote calls refresh() to see its own change
+    at once; other workers follow within one poll. Missing fields fall back to
+    `defaults`, so a fresh database runs on the built-in settings.
+    """
+
+    def __init__(self, collection, defaults: Dict[str, Any], poll_interval: float = 5.0):
+        self.collection = collection
+        self.defaults = dict(defaults)
+        self.poll_interval = poll_interval
+        self._current: Dict[str, Any] = dict(defaults)
+        self._marker: Optional[Tuple[Any, Any]] = None
+        self.reloads = 0
+
+    @property
+    def current(self) -> Dict[str, Any]:
+        return self._current
+
+    def get(self, key: str) -> Any:
+        return self._current.get(key, self.defaults.get(key))
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Reload if the stored settings changed; returns True if they did"""
+        head = await self.collection.find_one({}, {"_id": 0, "version": 1, "updated_at": 1})
+        marker = (head.get("version"), head.get("updated_at")) if head else None
+        if not force and marker == self._marker:
+            return False
+
+        doc = await self.collection.find_one({}, {"_id": 0}) if head else None
+        self._current = {**self.defaults, **(doc or {})}
+        self._marker = marker
+        self.reloads += 1
+        logging.info(f"AI settings loaded (version {marker[0] if marker else None})")
+        return True
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"AI settings refresh failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self._marker[0] if self._marker else None,
+            "updated_at": self._marker[1] if self._marker else None,
+            "reloads": self.reloads,
+            "poll_interval": self.poll_interval,
+        }
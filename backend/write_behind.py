@@ -0,0 +1,158 @@
+"""
+Write-Behind Module for MiraMind Professional
+Buffers telemetry writes and flushes them as per-collection bulk_write batches
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+class WriteBehindBuffer:
+    """
+    Collects inserts/updates and writes them in one unordered bulk_write per
+    collection, flushed every `flush_interval` seconds or as soon as
+    `max_batch` operations are pending. Operations must therefore not depend
+    on each other's order.
+
+    A batch that fails as a whole (network, failover) goes back to the front
+    of the queue and is retried with backoff, up to `max_attempts` flushes;
+    operations the server rejects (write errors) are dropped and counted.
+    Only for data that may lag (risk telemetry, video analyses, aggregates):
+    writes the user or a doctor must see immediately stay direct. Call close()
+    on shutdown to flush what is left.
+    """
+
+    # Retried writes may have landed the first time; a duplicate _id on insert means they did
+    DUPLICATE_KEY = 11000
+
+    def __init__(self, db, max_batch: int = 200, flush_interval: float = 0.5, max_attempts: int = 10, max_backoff: float = 30.0):
+        self.db = db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        # (operation, attempts so far) per collection, oldest first
+        self._pending: "OrderedDict[str, List[Tuple[Any, int]]]" = OrderedDict()
+        self._pending_count = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._failed_flushes = 0
+        self.flushes = 0
+        self.operations_written = 0
+        self.operations_retried = 0
+        self.operations_failed = 0
+        self.last_flush_ms: Optional[float] = None
+
+    def _enqueue(self, collection: str, operation: Any) -> None:
+        self._pending.setdefault(collection, []).append((operation, 0))
+        self._pending_count += 1
+        if self._pending_count >= self.max_batch:
+            self._wakeup.set()
+
+    def _requeue(self, collection: str, entries: List[Tuple[Any, int]]) -> None:
+        retry = [(operation, attempts) for operation, attempts in entries if attempts < self.max_attempts]
+        if len(retry) < len(entries):
+            self.operations_failed += len(entries) - len(retry)
+            logging.error(f"Write-behind dropped {len(entries) - len(retry)} {collection} writes after {self.max_attempts} attempts")
+        if retry:
+            self.operations_retried += len(retry)
+            self._pending[collection] = retry + self._pending.get(collection, [])
+            self._pending_count += len(retry)
+
+    def insert(self, collection: str, document: Dict[str, Any]) -> None:
+        self._enqueue(collection, InsertOne(document))
+
+    def update(self, collection: str, filter: Dict[str, Any], update: Any, upsert: bool = False) -> None:
+        self._enqueue(collection, UpdateOne(filter, update, upsert=upsert))
+
+    def flush_soon(self) -> None:
+        """Ask the background loop to flush now without waiting for it"""
+        self._wakeup.set()
+
+    async def flush(self) -> bool:
+        """Write everything pending; False if any batch failed as a whole and was requeued"""
+        async with self._flush_lock:
+            if not self._pending_count:
+                return True
+            batches, self._pending, self._pending_count = self._pending, OrderedDict(), 0
+
+            started = time.perf_counter()
+            results = await asyncio.gather(
+                *(
+                    self.db[collection].bulk_write([operation for operation, _ in entries], ordered=False)
+                    for collection, entries in batches.items()
+                ),
+                return_exceptions=True
+            )
+            succeeded = True
+            for (collection, entries), result in zip(batches.items(), results):
+                if isinstance(result, BulkWriteError):
+                    # Unordered: every operation was attempted, and only these were rejected
+                    rejected = [
+                        error for error in result.details.get("writeErrors", [])
+                        if not (error.get("code") == self.DUPLICATE_KEY and isinstance(entries[error["index"]][0], InsertOne))
+                    ]
+                    self.operations_failed += len(rejected)
+                    self.operations_written += len(entries) - len(rejected)
+                    if rejected:
+                        logging.error(f"Write-behind flush to {collection} rejected {len(rejected)} writes: {rejected}")
+                elif isinstance(result, Exception):
+                    succeeded = False
+                    logging.error(f"Write-behind flush to {collection} failed, requeueing {len(entries)} writes: {result}")
+                    self._requeue(collection, [(operation, attempts + 1) for operation, attempts in entries])
+                else:
+                    self.operations_written += len(entries)
+            self.flushes += 1
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+            return succeeded
+
+    def _next_delay(self) -> float:
+        if not self._failed_flushes:
+            return self.flush_interval
+        return min(self.flush_interval * 2 ** self._failed_flushes, self.max_backoff)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_delay())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                succeeded = await self.flush()
+            except Exception as e:
+                logging.error(f"Write-behind flush error: {e}")
+                succeeded = False
+            self._failed_flushes = 0 if succeeded else self._failed_flushes + 1
+
+    def start(self) -> None:
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the loop once its current flush is done, then flush the rest"""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._pending_count,
+            "flushes": self.flushes,
+            "operations_written": self.operations_written,
+            "operations_retried": self.operations_retried,
+            "operations_failed": self.operations_failed,
+            "last_flush_ms": self.last_flush_ms,
+        }
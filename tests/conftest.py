@@ -0,0 +1,56 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other by plain name, as they do under uvicorn
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture(scope="session")
+def server():
+    """server.py on an in-memory Mongo and the fake LLM backend"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import motor.motor_asyncio
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "berkai_test")
+    os.environ.setdefault("CORS_ORIGINS", "http://localhost:3000")
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["INDEX_SELF_CHECK"] = "off"
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    import server
+    return server
+
+
+@pytest.fixture(scope="session")
+def client(server):
+    """One app lifetime for the whole run: module-level locks and queues bind to its event loop"""
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def patient(server, client):
+    """A logged-in patient with one open therapy session; returns (headers, session_id)"""
+    user_id = f"patient-{os.urandom(4).hex()}"
+    token = f"token-{user_id}"
+
+    async def seed():
+        await server.db.users.insert_one({
+            "_id": user_id, "email": f"{user_id}@example.com", "name": "Test Patient",
+            "user_type": "patient", "user_id_number": f"BRK{user_id}", "assigned_patients": []
+        })
+        await server.db.user_sessions.insert_one({
+            "id": token, "user_id": user_id, "session_token": token,
+            "expires_at": datetime.now(timezone.utc) + timedelta(days=1)
+        })
+
+    client.portal.call(seed)
+    headers = {"Authorization": f"Bearer {token}"}
+    session_id = client.post("/api/sessions", headers=headers).json()["id"]
+    return headers, session_id
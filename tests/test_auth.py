@@ -0,0 +1,66 @@
+def test_admin_logout_on_another_worker_reaches_the_cache(server, client):
+    login = client.post("/api/admin/login", json={"email": server.ADMIN_EMAIL, "password": server.ADMIN_PASSWORD})
+    token = login.cookies["admin_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/admin/verify", headers=headers).status_code == 200
+
+    async def logout_elsewhere():
+        # What /admin/logout does on another worker; this worker's cache still holds the token
+        await server.db.admin_sessions.update_many(
+            {"session_token": token}, {"$set": {"revoked_at": server.datetime.now(server.timezone.utc)}}
+        )
+
+    client.portal.call(logout_elsewhere)
+    assert client.get("/api/admin/verify", headers=headers).status_code == 200
+
+    client.portal.call(server.sync_cache_invalidations)
+    assert client.get("/api/admin/verify", headers=headers).status_code == 401
+
+
+def test_signed_token_is_rejected_once_its_role_claim_is_stale(server, client, monkeypatch):
+    monkeypatch.setattr(server, "SESSION_SIGNING_SECRET", "test-secret")
+    user_id = "role-check@example.com"
+    expires_at = server.datetime.now(server.timezone.utc) + server.timedelta(hours=1)
+
+    async def seed():
+        await server.db.users.insert_one({
+            "_id": user_id, "email": user_id, "name": "Dr. Test",
+            "user_type": "doctor", "user_id_number": "BRKROLE", "assigned_patients": []
+        })
+
+    client.portal.call(seed)
+
+    def sessions(role):
+        token = server.issue_session_token("test-secret", f"sid-{role}", user_id, role, expires_at)
+        return client.get("/api/sessions", headers={"Authorization": f"Bearer {token}"}).status_code
+
+    assert sessions("doctor") == 200
+    assert sessions("patient") == 401
+
+
+def test_user_changes_and_logouts_on_another_worker_reach_the_cache(server, client, patient):
+    headers, _ = patient
+    token = headers["Authorization"].removeprefix("Bearer ")
+    assert client.get("/api/auth/me", headers=headers).json()["user_type"] == "patient"
+
+    async def change_elsewhere():
+        # What an admin route does on another worker: update the user and stamp auth_updated_at
+        session = await server.db.user_sessions.find_one({"session_token": token})
+        await server.db.users.update_one(
+            {"_id": session["user_id"]},
+            {"$set": {"name": "Renamed", "auth_updated_at": server.datetime.now(server.timezone.utc)}}
+        )
+
+    client.portal.call(change_elsewhere)
+    assert client.get("/api/auth/me", headers=headers).json()["name"] == "Test Patient"
+    client.portal.call(server.sync_cache_invalidations)
+    assert client.get("/api/auth/me", headers=headers).json()["name"] == "Renamed"
+
+    async def logout_elsewhere():
+        await server.db.user_sessions.update_many(
+            {"session_token": token}, {"$set": {"revoked_at": server.datetime.now(server.timezone.utc)}}
+        )
+
+    client.portal.call(logout_elsewhere)
+    client.portal.call(server.sync_cache_invalidations)
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+
+from auth_client import AuthServiceError, EmergentAuthClient
+
+PROFILE = {"email": "hasta@example.com", "name": "Hasta", "picture": None}
+
+
+def auth_client(responses):
+    """Client whose transport answers with `responses` in turn; returns (client, requests seen)"""
+    seen = []
+    pending = list(responses)
+
+    def handler(request):
+        seen.append(request)
+        response = pending.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    client = EmergentAuthClient("https://auth.test", max_retries=2, backoff=0, transport=httpx.MockTransport(handler))
+    return client, seen
+
+
+def exchange(client, session_id="sess-1"):
+    async def call():
+        try:
+            return await client.get_session_data(session_id)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(call())
+
+
+def test_profile_is_returned_on_success():
+    client, seen = auth_client([httpx.Response(200, json=PROFILE)])
+    assert exchange(client) == PROFILE
+    assert seen[0].url.path == "/auth/v1/env/oauth/session-data"
+    assert seen[0].headers["X-Session-ID"] == "sess-1"
+
+
+@pytest.mark.parametrize("status", [500, 502, 503, 504])
+def test_server_errors_are_retried(status):
+    client, seen = auth_client([httpx.Response(status), httpx.Response(200, json=PROFILE)])
+    assert exchange(client) == PROFILE
+    assert len(seen) == 2
+    assert client.stats()["retries"] == 1
+
+
+def test_timeouts_and_connection_errors_are_retried():
+    client, seen = auth_client([
+        httpx.ConnectTimeout("connect timed out"),
+        httpx.ReadTimeout("read timed out"),
+        httpx.Response(200, json=PROFILE),
+    ])
+    assert exchange(client) == PROFILE
+    assert len(seen) == 3
+
+
+@pytest.mark.parametrize("status", [400, 401, 404])
+def test_rejected_session_id_is_not_retried(status):
+    client, seen = auth_client([httpx.Response(status), httpx.Response(200, json=PROFILE)])
+    assert exchange(client) is None
+    assert len(seen) == 1
+    assert client.stats()["retries"] == 0
+
+
+def test_exhausted_retries_raise_auth_service_error():
+    client, seen = auth_client([httpx.Response(503), httpx.ConnectError("refused"), httpx.Response(503)])
+    with pytest.raises(AuthServiceError, match="HTTP 503"):
+        exchange(client)
+    assert len(seen) == 3
+    assert client.stats()["failures"] == 1
+
+
+@pytest.mark.parametrize("responses, status, detail", [
+    ([httpx.Response(503)] * 3, 502, "Auth service unavailable"),
+    ([httpx.Response(401)], 400, "Invalid session_id"),
+])
+def test_session_route_maps_auth_service_outcomes(server, client, monkeypatch, responses, status, detail):
+    monkeypatch.setattr(server, "emergent_auth", auth_client(responses)[0])
+    response = client.post("/api/auth/session", json={"session_id": "sess-1"})
+    assert response.status_code == status
+    assert response.json()["detail"] == detail
@@ -0,0 +1,181 @@
+import base64
+import time
+
+import pytest
+
+from llm_providers import FakeProvider, LatencyModel
+
+
+def test_provider_error_degrades_chat_instead_of_failing(server, client, patient, monkeypatch):
+    headers, session_id = patient
+    monkeypatch.setattr(server, "llm", FakeProvider(failure_rate=1.0))
+
+    response = client.post(f"/api/sessions/{session_id}/chat", headers=headers, json={"message": "merhaba"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["degraded"] is True
+    assert body["message"] == server.DEGRADED_REPLY
+    assert body["risk_assessment"]["risk_category"] == "low"
+
+    async def roles():
+        messages = await server.db.messages.find({"session_id": session_id}).to_list(10)
+        return [m["role"] for m in messages]
+
+    # The fallback reply is never saved, so the history holds only the user turn
+    assert client.portal.call(roles) == ["user"]
+
+
+def test_degraded_reply_is_not_replayed_for_the_same_key(server, client, patient, monkeypatch):
+    headers, session_id = patient
+    headers = {**headers, "Idempotency-Key": "turn-1"}
+    monkeypatch.setattr(server, "llm", FakeProvider(failure_rate=1.0))
+    first = client.post(f"/api/sessions/{session_id}/chat", headers=headers, json={"message": "merhaba"}).json()
+
+    monkeypatch.setattr(server, "llm", FakeProvider())
+    second = client.post(f"/api/sessions/{session_id}/chat", headers=headers, json={"message": "merhaba"}).json()
+
+    assert first["degraded"] is True
+    assert "degraded" not in second
+    assert "merhaba" in second["message"]
+
+    async def user_messages():
+        return await server.db.messages.count_documents({"session_id": session_id, "role": "user"})
+
+    assert client.portal.call(user_messages) == 1
+
+
+def test_stored_turn_preparation_holds_no_prompt_and_replays_on_another_worker(server, client, patient, monkeypatch):
+    headers, session_id = patient
+    client.post(f"/api/sessions/{session_id}/chat", headers=headers, json={"message": "ilk mesaj"})
+    headers = {**headers, "Idempotency-Key": "turn-2"}
+    monkeypatch.setattr(server, "llm", FakeProvider(failure_rate=1.0))
+    client.post(f"/api/sessions/{session_id}/chat", headers=headers, json={"message": "ikinci mesaj"})
+
+    async def stored_preparation():
+        session = await server.db.therapy_sessions.find_one({"id": session_id})
+        doc = await server.db.chat_turn_preparations.find_one({"_id": f"{session['user_id']}:turn-2"})
+        return doc["response"]
+
+    assert set(client.portal.call(stored_preparation)) == {
+        "user_message_id", "risk_result", "crisis_response", "video_analysis"
+    }
+
+    # Another worker: nothing in this process's store, only the Mongo row
+    monkeypatch.setattr(server.chat_turn_preparations, "_completed", {})
+    monkeypatch.setattr(server, "llm", FakeProvider())
+    prompts = []
+    build_chat_prompt = server.build_chat_prompt
+    monkeypatch.setattr(server, "build_chat_prompt", lambda *args: prompts.append(build_chat_prompt(*args)) or prompts[-1])
+    reply = client.post(f"/api/sessions/{session_id}/chat", headers=headers, json={"message": "ikinci mesaj"}).json()
+
+    assert "ikinci mesaj" in reply["message"]
+    assert "ilk mesaj" in prompts[0]
+    assert "ikinci mesaj" not in prompts[0]
+
+
+def test_hanging_vision_model_does_not_hold_the_chat_turn(server, client, patient, monkeypatch):
+    headers, session_id = patient
+    monkeypatch.setattr(server, "llm", FakeProvider(latency={"vision": LatencyModel("fixed:30")}))
+    monkeypatch.setattr(server, "LLM_CALL_TIMEOUT", 0.2)
+    frame = "data:image/jpeg;base64," + base64.b64encode(b"\xff\xd8frame").decode()
+
+    started = time.monotonic()
+    response = client.post(
+        f"/api/sessions/{session_id}/chat", headers=headers,
+        json={"message": "merhaba", "video_frame": frame, "analyze_video": True}
+    )
+
+    assert time.monotonic() - started < 5
+    body = response.json()
+    assert "degraded" not in body
+    assert body["video_analysis"]["summary"] == "Video analizi yapılamadı"
+    assert server.llm_breakers.get("gemini", server.ai_settings.get("vision_model")).stats()["calls"] >= 1
+
+
+def test_risk_summary_folds_each_turn(server, client, patient):
+    headers, session_id = patient
+    for text in ("merhaba", "kendime zarar vermek istiyorum", "merhaba"):
+        client.post(f"/api/sessions/{session_id}/chat", headers=headers, json={"message": text})
+
+    async def summaries():
+        await server.telemetry_writes.flush()
+        session = await server.db.therapy_sessions.find_one({"id": session_id})
+        user = await server.db.users.find_one({"_id": session["user_id"]})
+        return session["risk_summary"], user["risk_summary"]
+
+    for summary in client.portal.call(summaries):
+        view = server.risk_summary_view(summary)
+        assert [entry["category"] for entry in summary["recent"]] == ["low", "critical", "low"]
+        assert view["turns"] == 3
+        assert view["high_recent"] == 1
+        assert view["max_category"] == "critical"
+        assert summary["last_critical_at"] is not None
+
+
+def test_failed_message_insert_leaves_no_risk_assessment(server, client, patient, monkeypatch):
+    headers, session_id = patient
+
+    collection_type = type(server.db.messages)
+    insert_one = collection_type.insert_one
+
+    async def failing_insert(self, *args, **kwargs):
+        if self.name == "messages":
+            raise RuntimeError("insert failed")
+        return await insert_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, "insert_one", failing_insert)
+    with pytest.raises(RuntimeError):
+        client.post(f"/api/sessions/{session_id}/chat", headers=headers, json={"message": "merhaba"})
+    monkeypatch.undo()
+
+    async def leftovers():
+        await server.telemetry_writes.flush()
+        session = await server.db.therapy_sessions.find_one({"id": session_id})
+        return await server.db.risk_assessments.count_documents({"session_id": session_id}), session.get("risk_summary")
+
+    assert client.portal.call(leftovers) == (0, None)
+
+
+def test_stream_sends_the_risk_assessment_before_slow_stages_finish(server, client, patient, monkeypatch):
+    headers, session_id = patient
+    monkeypatch.setattr(server, "llm", FakeProvider(latency={"vision": LatencyModel("fixed:0.3")}, token_delay=0))
+    frame = "data:image/jpeg;base64," + base64.b64encode(b"\xff\xd8frame").decode()
+    data = {"message": "merhaba", "video_frame": frame, "analyze_video": True}
+
+    async def turn():
+        session = await server.db.therapy_sessions.find_one({"id": session_id})
+        user = server.User(**await server.db.users.find_one({"_id": session["user_id"]}))
+        started = time.monotonic()
+        risk_at = []
+        await server.begin_chat_turn(user, session_id, data, on_risk=lambda risk: risk_at.append(time.monotonic()))
+        return risk_at[0] - started, time.monotonic() - started
+
+    risk_after, turn_after = client.portal.call(turn)
+    assert risk_after < 0.1 < 0.3 <= turn_after
+
+    response = client.post(f"/api/sessions/{session_id}/chat/stream", headers=headers, json=data)
+    events = [line.split(": ", 1)[1] for line in response.text.splitlines() if line.startswith("event: ")]
+    assert events[0] == "risk_assessment"
+    assert events[-1] == "done"
+
+
+def test_profile_context_updated_on_another_worker_is_picked_up(server, client, patient):
+    headers, session_id = patient
+
+    async def scenario():
+        session = await server.db.therapy_sessions.find_one({"id": session_id})
+        user_id = session["user_id"]
+        await server.db.user_profiles.insert_one(
+            server.UserProfile(user_id=user_id, profile_context="eski bağlam").model_dump()
+        )
+        first = await server.load_profile_context(user_id, session_id)
+        # What refresh_profile_context does on another worker, behind this worker's cache
+        await server.db.user_profiles.update_one(
+            {"user_id": user_id},
+            {"$set": {"profile_context": "yeni bağlam"}, "$inc": {"profile_context_version": 1}}
+        )
+        second = await server.load_profile_context(user_id, session_id)
+        return first, second
+
+    assert client.portal.call(scenario) == ("eski bağlam", "yeni bağlam")
@@ -0,0 +1,127 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitBreakers, ProviderUnavailable, guarded_call, hedged_call
+
+
+def test_breaker_opens_on_failure_rate_and_fails_fast():
+    breaker = CircuitBreaker("openai/gpt", min_calls=4, failure_rate=0.5)
+    for succeeded in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(succeeded, 0.1)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_slow_calls_open_the_breaker():
+    breaker = CircuitBreaker("openai/gpt", min_calls=2, failure_rate=0.5, slow_call_seconds=1)
+    breaker.record(True, 5)
+    breaker.record(True, 5)
+    assert breaker.state == "open"
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("openai/gpt", min_calls=1, failure_rate=0.5, open_seconds=0)
+    breaker.record(False, 0.1)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("openai/gpt", min_calls=1, failure_rate=0.5, open_seconds=0)
+    breaker.record(False, 0.1)
+    breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
+
+
+def test_guarded_call_timeout_counts_as_failure():
+    breaker = CircuitBreaker("openai/gpt", min_calls=1, failure_rate=0.5)
+
+    async def call():
+        await asyncio.sleep(1)
+
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(guarded_call(breaker, call, timeout=0.01))
+    assert breaker.state == "open"
+
+
+def test_ignored_errors_do_not_count():
+    breaker = CircuitBreaker("openai/gpt", min_calls=1, failure_rate=0.5)
+
+    async def call():
+        raise KeyError("local")
+
+    with pytest.raises(KeyError):
+        asyncio.run(guarded_call(breaker, call, timeout=1, ignore=(KeyError,)))
+    assert breaker.state == "closed"
+    assert breaker.stats()["calls"] == 0
+
+
+def test_admission_wait_is_not_provider_latency():
+    breaker = CircuitBreaker("openai/gpt", min_calls=1, failure_rate=0.5)
+
+    @asynccontextmanager
+    async def slow_admission():
+        await asyncio.sleep(0.1)
+        yield
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    assert asyncio.run(guarded_call(breaker, call, timeout=0.05, admit=slow_admission)) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_hedge_answers_from_fallback_when_primary_is_slow():
+    breakers = CircuitBreakers()
+
+    async def slow():
+        await asyncio.sleep(1)
+        return "primary"
+
+    async def fast():
+        return "fallback"
+
+    async def scenario():
+        return await hedged_call(
+            breakers,
+            (breakers.get("openai", "a"), slow),
+            (breakers.get("openai", "b"), fast),
+            timeout=2, hedge_delay=0.01
+        )
+
+    assert asyncio.run(scenario()) == "fallback"
+    assert (breakers.hedges, breakers.hedge_wins) == (1, 1)
+
+
+def test_primary_backpressure_is_not_hedged():
+    breakers = CircuitBreakers()
+    fallback_calls = []
+
+    async def overloaded():
+        raise KeyError("queue full")
+
+    async def fallback():
+        fallback_calls.append(1)
+        return "fallback"
+
+    async def scenario():
+        return await hedged_call(
+            breakers,
+            (breakers.get("openai", "a"), overloaded),
+            (breakers.get("openai", "b"), fallback),
+            timeout=1, hedge_delay=0.5, ignore=(KeyError,)
+        )
+
+    with pytest.raises(KeyError):
+        asyncio.run(scenario())
+    assert fallback_calls == []
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyConflict, IdempotencyStore, request_fingerprint
+
+SCOPE = ("user-1", "key-1")
+
+
+def test_completed_result_is_replayed_without_rerunning():
+    store = IdempotencyStore()
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        return {"message": "hi"}
+
+    async def scenario():
+        first = await store.run(SCOPE, "fp", execute)
+        second = await store.run(SCOPE, "fp", execute)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second == {"message": "hi"}
+    assert len(calls) == 1
+    assert store.stats()["replays"] == 1
+
+
+def test_concurrent_duplicates_share_one_execution():
+    store = IdempotencyStore()
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def scenario():
+        return await asyncio.gather(*(store.run(SCOPE, "fp", execute) for _ in range(3)))
+
+    assert asyncio.run(scenario()) == ["done"] * 3
+    assert len(calls) == 1
+    assert store.stats()["coalesced"] == 2
+
+
+def test_key_reused_with_different_request_conflicts():
+    store = IdempotencyStore()
+
+    async def execute():
+        return "done"
+
+    async def scenario():
+        await store.run(SCOPE, request_fingerprint({"body": 1}), execute)
+        await store.run(SCOPE, request_fingerprint({"body": 2}), execute)
+
+    with pytest.raises(IdempotencyConflict):
+        asyncio.run(scenario())
+
+
+def test_failures_are_not_stored():
+    store = IdempotencyStore()
+    attempts = []
+
+    async def execute():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+        return "recovered"
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await store.run(SCOPE, "fp", execute)
+        return await store.run(SCOPE, "fp", execute)
+
+    assert asyncio.run(scenario()) == "recovered"
+    assert len(attempts) == 2
+
+
+def test_scopes_are_per_user():
+    store = IdempotencyStore()
+
+    async def scenario():
+        first = await store.run(("user-1", "k"), "fp", lambda: asyncio.sleep(0, result="one"))
+        second = await store.run(("user-2", "k"), "fp", lambda: asyncio.sleep(0, result="two"))
+        return first, second
+
+    assert asyncio.run(scenario()) == ("one", "two")
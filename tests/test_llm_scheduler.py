@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from llm_scheduler import LLMOverloaded, LLMScheduler
+
+
+def test_limit_caps_concurrent_calls():
+    scheduler = LLMScheduler({"openai": 2})
+    active = []
+    peak = []
+
+    async def call():
+        active.append(1)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.pop()
+
+    async def scenario():
+        await asyncio.gather(*(scheduler.run("openai", "chat", call) for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert max(peak) == 2
+    assert scheduler.stats()["openai"]["lanes"]["chat"]["started"] == 6
+
+
+def test_waiting_chat_is_served_before_earlier_summaries():
+    scheduler = LLMScheduler({"openai": 1})
+    order = []
+
+    async def call(name):
+        order.append(name)
+        await asyncio.sleep(0.01)
+
+    async def scenario():
+        holder = asyncio.ensure_future(scheduler.run("openai", "chat", lambda: call("first")))
+        await asyncio.sleep(0)
+        summaries = [asyncio.ensure_future(scheduler.run("openai", "summary", lambda i=i: call(f"summary{i}"))) for i in range(2)]
+        await asyncio.sleep(0)
+        chat = asyncio.ensure_future(scheduler.run("openai", "chat", lambda: call("chat")))
+        await asyncio.gather(holder, chat, *summaries)
+
+    asyncio.run(scenario())
+    assert order == ["first", "chat", "summary0", "summary1"]
+
+
+def test_lower_lane_share_leaves_slots_for_chat():
+    scheduler = LLMScheduler({"openai": 4}, lane_share={"summary": 0.5})
+    assert scheduler.stats()["openai"]["lanes"]["summary"]["cap"] == 2
+
+
+def test_full_queue_is_rejected():
+    scheduler = LLMScheduler({"openai": 1}, max_queue={"summary": 1})
+
+    async def scenario():
+        async with scheduler.slot("openai", "summary"):
+            queued = asyncio.ensure_future(scheduler.run("openai", "summary", lambda: asyncio.sleep(0)))
+            await asyncio.sleep(0)
+            with pytest.raises(LLMOverloaded) as excinfo:
+                await scheduler.run("openai", "summary", lambda: asyncio.sleep(0))
+        await queued
+        return excinfo.value
+
+    assert asyncio.run(scenario()).reason == "queue full"
+
+
+def test_queue_timeout_raises_and_frees_the_queue():
+    scheduler = LLMScheduler({"openai": 1}, queue_timeout={"chat": 0.01})
+
+    async def scenario():
+        async with scheduler.slot("openai", "chat"):
+            with pytest.raises(LLMOverloaded) as excinfo:
+                await scheduler.run("openai", "chat", lambda: asyncio.sleep(0))
+        # The timed-out waiter must not hold a slot or a queue place
+        await scheduler.run("openai", "chat", lambda: asyncio.sleep(0))
+        return excinfo.value
+
+    assert asyncio.run(scenario()).reason == "queue timeout"
+    lane = scheduler.stats()["openai"]["lanes"]["chat"]
+    assert (lane["active"], lane["queued"], lane["timed_out"]) == (0, 0, 1)
+
+
+def test_unknown_provider_gets_default_limit():
+    scheduler = LLMScheduler({}, default_limit=3)
+
+    async def scenario():
+        await scheduler.run("gemini", "vision", lambda: asyncio.sleep(0))
+
+    asyncio.run(scenario())
+    assert scheduler.stats()["gemini"]["limit"] == 3
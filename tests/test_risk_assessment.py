@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from bench_risk_assessment import MISSED_BEFORE, legacy_analyze_message_risk, random_message
+from risk_assessment import analyze_message_risk, normalize_text, score_messages
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("ÖLMEEEK İSTİYORUM!!", "olmek istiyorum "),
+    ("Kendime-ZARAR", "kendime zarar"),
+    ("hiçbir...   şey", "hicbir sey"),
+    ("yalnızım 😢 çaresizim", "yalnizim caresizim"),
+    ("Iıİi", "i"),
+    ("", ""),
+])
+def test_normalize_text(text, expected):
+    assert normalize_text(text) == expected
+
+
+def test_lowercase_messages_score_exactly_as_the_legacy_matcher():
+    rng = random.Random(7)
+    for _ in range(3000):
+        message = random_message(rng, rng.randint(1, 60), 0.15)
+        assert analyze_message_risk(message) == legacy_analyze_message_risk(message), message
+
+
+@pytest.mark.parametrize("message", MISSED_BEFORE)
+def test_messages_the_legacy_matcher_missed_are_detected(message):
+    assert analyze_message_risk(message)["risk_level"] > legacy_analyze_message_risk(message)["risk_level"]
+
+
+def test_turkish_uppercase_and_stretched_crisis_messages_are_critical():
+    for message in ("İNTİHAR ETMEK İSTİYORUM", "ölmeeeek istiyorummm", "KENDİME ZARAR VERECEĞİM"):
+        risk = analyze_message_risk(message)
+        assert risk["risk_category"] == "critical", message
+        assert risk["suicide_risk"] is True
+
+
+def test_keyword_in_two_lexicons_counts_in_both():
+    risk = analyze_message_risk("kendime zarar vermek istiyorum")
+    assert risk["risk_indicators"] == ["İntihar göstergesi: 'kendime zarar'", "Kendine zarar göstergesi: 'kendime zarar'"]
+    assert risk["risk_level"] == 7
+    assert risk["self_harm_risk"] is True
+
+
+def test_nested_keywords_are_all_reported():
+    risk = analyze_message_risk("kendimi kesiyorum")
+    assert "Kendine zarar göstergesi: 'kesiyorum'" in risk["risk_indicators"]
+    assert "Kendine zarar göstergesi: 'kendimi kesiyorum'" in risk["risk_indicators"]
+
+
+def test_benign_message_is_low_risk():
+    assert analyze_message_risk("Bugün hava çok güzeldi, yürüyüşe çıktım.") == {
+        "risk_level": 0,
+        "risk_category": "low",
+        "suicide_risk": False,
+        "self_harm_risk": False,
+        "crisis_detected": False,
+        "risk_indicators": []
+    }
+
+
+def test_score_messages_keeps_order():
+    messages = ["merhaba", "intihar", "panik atak"]
+    assert [risk["risk_category"] for risk in score_messages(messages)] == ["low", "critical", "medium"]
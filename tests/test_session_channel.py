@@ -0,0 +1,32 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+
+def test_handshake_from_a_foreign_origin_is_refused(client, patient):
+    headers, session_id = patient
+
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect(
+            f"/api/sessions/{session_id}/ws", headers={**headers, "Origin": "https://evil.example"}
+        ):
+            pass
+
+    assert refused.value.code == 1008
+
+
+def test_allowed_origin_is_accepted(client, patient):
+    headers, session_id = patient
+
+    with client.websocket_connect(
+        f"/api/sessions/{session_id}/ws", headers={**headers, "Origin": "http://localhost:3000"}
+    ) as ws:
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+
+
+def test_audio_end_without_audio_is_an_empty_audio_error(client, patient):
+    headers, session_id = patient
+
+    with client.websocket_connect(f"/api/sessions/{session_id}/ws", headers=headers) as ws:
+        ws.send_json({"type": "audio_end"})
+        assert ws.receive_json() == {"type": "error", "data": {"detail": "No audio received"}}
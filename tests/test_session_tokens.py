@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta, timezone
+
+from session_tokens import _b64encode, _signature, issue_session_token, is_signed_token, verify_session_token
+
+SECRET = "test-secret"
+
+
+def issue(expires_in=timedelta(hours=1), secret=SECRET):
+    return issue_session_token(secret, "sess-1", "user-1", "patient", datetime.now(timezone.utc) + expires_in)
+
+
+def test_issued_token_verifies_with_claims():
+    token = issue()
+    assert is_signed_token(token)
+    claims = verify_session_token(SECRET, token)
+    assert claims["sid"] == "sess-1"
+    assert claims["uid"] == "user-1"
+    assert claims["role"] == "patient"
+    assert claims["expires_at"] > datetime.now(timezone.utc)
+
+
+def test_expired_token_is_rejected():
+    assert verify_session_token(SECRET, issue(expires_in=timedelta(seconds=-1))) is None
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    assert verify_session_token(SECRET, issue(secret="other-secret")) is None
+
+
+def test_tampered_payload_is_rejected():
+    prefix, _, signature = issue().split(".")
+    forged = _b64encode(b'{"sid":"sess-1","uid":"admin","role":"doctor","exp":9999999999}')
+    assert verify_session_token(SECRET, f"{prefix}.{forged}.{signature}") is None
+
+
+def test_malformed_tokens_are_rejected():
+    for token in ["", "berkai_st", "berkai_st.a", "other.a.b", "berkai_st.a.b.c", "berkai_st.!!!.x"]:
+        assert verify_session_token(SECRET, token) is None
+
+
+def test_non_ascii_tokens_are_rejected_not_raised():
+    prefix, payload, signature = issue().split(".")
+    assert verify_session_token(SECRET, f"{prefix}.{payload}é.{signature}") is None
+    assert verify_session_token(SECRET, f"{prefix}.{payload}.{signature}é") is None
+
+
+def test_validly_signed_garbage_claims_are_rejected():
+    for raw in [b"not json", b"[1, 2]", b'{"sid":"s"}', b'{"sid":"s","uid":"u","role":"r","exp":"soon"}']:
+        payload = _b64encode(raw)
+        assert verify_session_token(SECRET, f"berkai_st.{payload}.{_signature(SECRET, payload)}") is None
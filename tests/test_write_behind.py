@@ -0,0 +1,95 @@
+import asyncio
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from write_behind import WriteBehindBuffer
+
+
+class FakeCollection:
+    def __init__(self, failures=(), delay=0.0):
+        self.failures = list(failures)
+        self.delay = delay
+        self.written = []
+        self.calls = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append(ordered)
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            raise self.failures.pop(0)
+        self.written.extend(operations)
+
+
+class FakeDB(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+
+def test_failed_batch_is_requeued_and_written_on_a_later_flush():
+    db = FakeDB(risk_assessments=FakeCollection(failures=[AutoReconnect("primary stepped down")]))
+    buffer = WriteBehindBuffer(db)
+
+    async def scenario():
+        buffer.insert("risk_assessments", {"id": "a"})
+        buffer.insert("risk_assessments", {"id": "b"})
+        first = await buffer.flush()
+        buffer.insert("risk_assessments", {"id": "c"})
+        second = await buffer.flush()
+        return first, second
+
+    assert asyncio.run(scenario()) == (False, True)
+    assert [op._doc["id"] for op in db["risk_assessments"].written] == ["a", "b", "c"]
+    assert db["risk_assessments"].calls == [False, False]
+    assert buffer.stats()["operations_written"] == 3
+    assert buffer.stats()["operations_retried"] == 2
+
+
+def test_writes_are_dropped_after_max_attempts():
+    db = FakeDB(video_analyses=FakeCollection(failures=[AutoReconnect("down")] * 3))
+    buffer = WriteBehindBuffer(db, max_attempts=2)
+
+    async def scenario():
+        buffer.insert("video_analyses", {"id": "a"})
+        return [await buffer.flush() for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [False, False, True]
+    assert buffer.stats()["operations_failed"] == 1
+    assert buffer.stats()["pending"] == 0
+    assert db["video_analyses"].written == []
+
+
+def test_only_rejected_writes_count_as_failed():
+    error = BulkWriteError({"writeErrors": [
+        {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+        {"index": 2, "code": 121, "errmsg": "document failed validation"},
+    ]})
+    db = FakeDB(risk_assessments=FakeCollection(failures=[error]))
+    buffer = WriteBehindBuffer(db)
+
+    async def scenario():
+        for doc_id in "abc":
+            buffer.insert("risk_assessments", {"id": doc_id})
+        return await buffer.flush()
+
+    # A duplicate _id on insert is an earlier attempt that landed
+    assert asyncio.run(scenario()) is True
+    assert buffer.stats()["operations_written"] == 2
+    assert buffer.stats()["operations_failed"] == 1
+    assert buffer.stats()["pending"] == 0
+
+
+def test_close_lets_an_in_progress_flush_finish():
+    db = FakeDB(risk_assessments=FakeCollection(delay=0.05))
+    buffer = WriteBehindBuffer(db, flush_interval=0.01)
+
+    async def scenario():
+        buffer.start()
+        buffer.insert("risk_assessments", {"id": "a"})
+        await asyncio.sleep(0.03)  # the loop is now inside bulk_write
+        buffer.insert("risk_assessments", {"id": "b"})
+        await buffer.close()
+
+    asyncio.run(scenario())
+    assert [op._doc["id"] for op in db["risk_assessments"].written] == ["a", "b"]
+    assert buffer.stats()["pending"] == 0